@@ -3,15 +3,23 @@ import datetime
 import feedparser
 import json
 import os
+import pathlib
+import queue
 import random
 import re
+import select
 import sqlite3
 import ssl
 import subprocess
+import sys
 import threading
 import time
 import requests
-from collections import deque
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import OrderedDict, deque, namedtuple
+import concurrent.futures
+from concurrent.futures import Future
 
 import irc.bot
 import irc.connection
@@ -32,6 +40,49 @@ irc.client.ServerConnection.buffer_class = buffer.LenientDecodingLineBuffer
 class IgnoreError(Exception):
     pass
 
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with a default timeout, so a hung server doesn't hang the calling thread."""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+def new_http_session(timeout=None, retries=None, backoff=None, pool_size=None):
+    """requests.Session with keep-alive connection pools per host, a default (connect, read)
+    timeout, and retries of idempotent requests on connection errors and 5xx answers.
+    Unset arguments come from conf.py, read on every call so importing classes doesn't need them."""
+    timeout = timeout if timeout is not None else http_timeout
+    retries = retries if retries is not None else http_retries
+    backoff = backoff if backoff is not None else http_backoff
+    pool_size = pool_size if pool_size is not None else http_pool_size
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,  # the last answer is returned as is
+    )
+    adapter = TimeoutHTTPAdapter(timeout=timeout, max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def http_session():
+    """The session shared by all clients."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = new_http_session()
+        return _http_session
+
 class PVR(object):
     def __init__(self, name):
         self.url = None
@@ -44,45 +95,1148 @@ class PVR(object):
         self.name = name
 
 
+class PVRWriter:
+    """Writes release profile changes in the background, with one thread per *arr instance,
+    so a slow or unreachable instance holds up neither the caller nor the other instances.
+    Failed PUTs are retried with exponential backoff and jitter, up to max_attempts times.
+    After breaker_threshold failures in a row an instance is left alone for breaker_cooldown
+    seconds. Changes are kept in the outbox table of scene2arr.db until they are written or
+    given up on, so changes interrupted by a restart are written by the next run."""
+
+    def __init__(self, logger, dbname):
+        self.logger = logger
+        self.max_attempts = pvr_write_max_attempts
+        self.backoff = pvr_write_backoff
+        self.max_backoff = pvr_write_max_backoff
+        self.breaker_threshold = pvr_breaker_threshold
+        self.breaker_cooldown = pvr_breaker_cooldown
+        # guards pvr.required of all instances, shared with PVRUpdateQueue
+        self.lock = threading.RLock()
+        self.db = DB(dbname, check_same_thread=False)
+        self.db_lock = threading.Lock()
+        self.pvrs = {}
+        self.queues = {}  # pvr.name -> queue.Queue of jobs
+        self.threads = []
+        self.failures = {}  # pvr.name -> consecutive failures
+        self.open_until = {}  # pvr.name -> time.monotonic() until the circuit breaker is open
+        self.outstanding = 0
+        self.done = threading.Condition()
+        self.stop_event = threading.Event()
+        self.replayed = False
+        self.given_up = 0  # bumped whenever changes are dropped, so PVRManager can rebuild its known groups
+
+    def set_pvrs(self, pvrs):
+        with self.lock:
+            self.pvrs = {pvr.name: pvr for pvr in pvrs}
+            if not self.replayed:
+                self.replayed = True
+                self._replay()
+
+    def _replay(self):
+        with self.db_lock:
+            # left over by versions that kept changes after giving up on them
+            self.db.cursor.execute("DELETE FROM outbox WHERE attempts >= ?", (self.max_attempts,))
+            self.db.connection.commit()
+            self.db.cursor.execute(
+                "SELECT id, pvr, changes, attempts FROM outbox WHERE attempts < ? ORDER BY id",
+                (self.max_attempts,),
+            )
+            rows = self.db.cursor.fetchall()
+        for row_id, pvr_name, changes, attempts in rows:
+            if pvr_name not in self.pvrs:
+                continue
+            self.logger.info(f"{INFO} Retrying unsaved changes to {pvr_name}.")
+            self._enqueue(pvr_name, {"id": row_id, "changes": json.loads(changes), "attempts": attempts})
+
+    def submit(self, pvr, changes):
+        """Persist changes ({restriction: (action, groupname, release)}) for pvr and return right away."""
+        stored = {
+            restriction: (action, groupname, {"dirname": release["dirname"], "time": release["time"]} if release else None)
+            for restriction, (action, groupname, release) in changes.items()
+        }
+        with self.db_lock:
+            self.db.cursor.execute(
+                "INSERT INTO outbox (pvr, changes, attempts, timestamp) VALUES (?, ?, ?, ?)",
+                (pvr.name, json.dumps(stored), 0, int(datetime.datetime.now(datetime.timezone.utc).timestamp())),
+            )
+            self.db.connection.commit()
+            row_id = self.db.cursor.lastrowid
+        if pvr.name not in self.pvrs:
+            with self.lock:
+                self.pvrs[pvr.name] = pvr
+        self._enqueue(pvr.name, {"id": row_id, "changes": stored, "attempts": 0})
+
+    def _enqueue(self, pvr_name, job):
+        with self.done:
+            self.outstanding += 1
+        with self.lock:
+            if pvr_name not in self.queues:
+                self.queues[pvr_name] = queue.Queue()
+                thread = threading.Thread(target=self._run, args=(pvr_name,), daemon=True)
+                self.threads.append(thread)
+                thread.start()
+        self.queues[pvr_name].put(job)
+
+    def _run(self, pvr_name):
+        jobs = self.queues[pvr_name]
+        while not self.stop_event.is_set():
+            try:
+                batch = [jobs.get(timeout=1)]
+            except queue.Empty:
+                continue
+            # everything that piled up in the meantime goes out with the same PUT
+            while True:
+                try:
+                    batch.append(jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._deliver(pvr_name, batch)
+            except Exception as e:
+                self.logger.error(f"Error updating {pvr_name}: {e}", exc_info=True)
+            finally:
+                with self.done:
+                    self.outstanding -= len(batch)
+                    self.done.notify_all()
+
+    @staticmethod
+    def _apply(pvr, changes):
+        for restriction, (action, groupname, release) in changes.items():
+            if action == "add" and restriction not in pvr.required:
+                pvr.required.append(restriction)
+            elif action == "remove" and restriction in pvr.required:
+                pvr.required.remove(restriction)
+
+    @staticmethod
+    def _revert(pvr, changes):
+        for restriction, (action, groupname, release) in changes.items():
+            if action == "add" and restriction in pvr.required:
+                pvr.required.remove(restriction)
+            elif action == "remove" and restriction not in pvr.required:
+                pvr.required.append(restriction)
+
+    def revert(self, pvr, changes):
+        """Undo changes the caller already applied to pvr.required, but couldn't submit."""
+        with self.lock:
+            self._revert(pvr, changes)
+
+    def _reload(self, pvr):
+        # Fetch the profile without holding the lock, then swap it in
+        fresh = PVR(pvr.name)
+        fresh.url = pvr.url
+        fresh.apikey = pvr.apikey
+        scene2arr.load_pvr(self.logger, fresh)
+        if fresh.required is None or fresh.skip:
+            return False
+        with self.lock:
+            pvr.response = fresh.response
+            pvr.required = fresh.required
+            pvr.ignored = fresh.ignored
+        return True
+
+    def _deliver(self, pvr_name, batch):
+        restrictions = ", ".join(restriction for job in batch for restriction in job["changes"])
+        attempts = max(job["attempts"] for job in batch)
+        while not self.stop_event.is_set():
+            # wait while the circuit breaker is open
+            wait = self.open_until.get(pvr_name, 0) - time.monotonic()
+            if wait > 0 and self.stop_event.wait(timeout=wait):
+                return
+
+            with self.lock:
+                pvr = self.pvrs[pvr_name]
+                # (re-)apply on every attempt, the profile may have been reloaded in the meantime
+                for job in batch:
+                    self._apply(pvr, job["changes"])
+                payload = scene2arr.pvr_payload(pvr)
+            try:
+                status_code = scene2arr.put_pvr(pvr, payload).status_code
+            except requests.exceptions.RequestException as e:
+                self.logger.debug(f"{VERBOSE} {pvr_name}: {e}")
+                status_code = None
+
+            if status_code == 202:
+                self._succeeded(pvr, batch)
+                return
+
+            attempts += 1
+            self.failures[pvr_name] = self.failures.get(pvr_name, 0) + 1
+            self.logger.error(
+                f"{ERROR} Could not modify {restrictions} in {pvr.name}. Response code: {status_code} (attempt {attempts}/{self.max_attempts})"
+            )
+            with self.db_lock:
+                if attempts >= self.max_attempts:
+                    self.db.cursor.executemany("DELETE FROM outbox WHERE id=?", [(job["id"],) for job in batch])
+                else:
+                    self.db.cursor.executemany(
+                        "UPDATE outbox SET attempts=? WHERE id=?", [(attempts, job["id"]) for job in batch]
+                    )
+                self.db.connection.commit()
+
+            if attempts >= self.max_attempts:
+                # Give up, forget the changes so the groups get queued again when they come up
+                with self.lock:
+                    for job in batch:
+                        self._revert(pvr, job["changes"])
+                    self.given_up += 1
+                self.logger.error(f"{ERROR} Giving up on {restrictions} in {pvr.name}.")
+                return
+
+            if self.failures[pvr_name] >= self.breaker_threshold:
+                self.open_until[pvr_name] = time.monotonic() + self.breaker_cooldown
+                self.logger.warning(f"{pvr_name} failed {self.failures[pvr_name]} times in a row, pausing updates for {self.breaker_cooldown}s.")
+            if status_code is not None and 400 <= status_code < 500:
+                # Most likely the profile was changed elsewhere, reload it before the next attempt
+                self.logger.debug(f"{VERBOSE} {pvr_name} answered {status_code}, reloading its release profile.")
+                try:
+                    self._reload(pvr)
+                except requests.exceptions.RequestException as e:
+                    self.logger.debug(f"{VERBOSE} {pvr_name}: {e}")
+
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
+            if self.stop_event.wait(timeout=delay):
+                return
+
+    def _succeeded(self, pvr, batch):
+        self.failures[pvr.name] = 0
+        self.open_until.pop(pvr.name, None)
+        changes = [change for job in batch for change in job["changes"].items()]
+        with self.db_lock:
+            self.db.cursor.executemany("DELETE FROM outbox WHERE id=?", [(job["id"],) for job in batch])
+            # commits the deletion as well
+            scene2arr.record_groups(self.db, pvr, [(groupname, release) for restriction, (action, groupname, release) in changes])
+        for restriction, (action, groupname, release) in changes:
+            release_info = f" Release: {release['dirname']}" if release else ""
+            if action == "add":
+                self.logger.info(f"{ADDED} {restriction} to {pvr.name}!{release_info}")
+            else:
+                self.logger.info(f"{REMOVED} {restriction} from {pvr.name}!")
+
+    def data_version(self):
+        """Changes whenever another connection (e.g. scene2arr.py -a/-r) commits to scene2arr.db."""
+        with self.db_lock:
+            self.db.cursor.execute("PRAGMA data_version")
+            return self.db.cursor.fetchone()[0]
+
+    def close(self, timeout=None):
+        """Wait up to timeout seconds for pending changes, anything left stays in the outbox."""
+        with self.done:
+            self.done.wait_for(lambda: self.outstanding == 0, timeout=timeout)
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        self.db.connection.close()
+
+
+class PVRUpdateQueue:
+    """Collects group additions and removals per *arr instance, so flush() can hand each
+    release profile to the PVRWriter as a single PUT instead of one PUT per group."""
+
+    def __init__(self, logger, writer):
+        self.logger = logger
+        self.writer = writer
+        self.lock = writer.lock
+        self.pending = {}  # pvr.name -> (pvr, {restriction: (action, groupname, release)})
+
+    def _queue(self, pvr, action, groupname, release):
+        restriction = "-" + groupname
+        with self.lock:
+            if action == "add":
+                if restriction in pvr.required:
+                    return False
+                pvr.required.append(restriction)
+            else:
+                if restriction not in pvr.required:
+                    return False
+                pvr.required.remove(restriction)
+            changes = self.pending.setdefault(pvr.name, (pvr, {}))[1]
+            if changes.get(restriction, (action,))[0] != action:
+                # removing a group that is still waiting to be added (or vice versa) cancels out
+                del changes[restriction]
+            else:
+                changes[restriction] = (action, groupname, release)
+            return True
+
+    def add(self, pvr, groupname, release=None):
+        """Add -GROUP to the required tags of pvr. Returns False if it is already there."""
+        return self._queue(pvr, "add", groupname, release)
+
+    def remove(self, pvr, groupname):
+        """Remove -GROUP from the required tags of pvr. Returns False if it isn't there."""
+        return self._queue(pvr, "remove", groupname, None)
+
+    def flush(self):
+        """Hand every release profile with pending changes to the writer, without waiting for
+        the PUTs. Returns False if the changes couldn't be stored in the outbox."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        success = True
+        for pvr, changes in pending.values():
+            if not changes:
+                continue
+            try:
+                self.writer.submit(pvr, changes)
+            except sqlite3.Error as error:
+                self.logger.error(f"{ERROR} Could not queue {', '.join(changes)} for {pvr.name}: {error}", exc_info=True)
+                self.writer.revert(pvr, changes)
+                success = False
+        return success
+
+    def run(self, interval=30):
+        # Flush every interval seconds, and one last time on shutdown
+        stop_event = getattr(self, "stop_event", threading.Event())
+        while not stop_event.wait(timeout=interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Error updating release profiles: {e}", exc_info=True)
+        self.flush()
+
+    def close(self, timeout=None):
+        self.flush()
+        self.writer.close(timeout)
+
+
+class PVRManager:
+    """Keeps the release profiles of the *arr instances in memory while the IRC bots run,
+    so adding a group from a pre only costs the PUT itself. Profiles are reloaded when they
+    are older than max_age seconds, or when another process changed scene2arr.db (-a/-r).
+    Changes are collected in a PVRUpdateQueue and written every update_window seconds by
+    run_updates(). Groups that every instance already requires are kept in known_groups,
+    so pres from them can be dropped before they are parsed."""
+
+    def __init__(self, args, logger, max_age=3600, update_window=30):
+        self.args = args
+        self.logger = logger
+        self.max_age = max_age
+        self.update_window = update_window
+        self.lock = threading.Lock()
+        # runs the schema check once, the writer keeps its own connection
+        scene2arr.create_scene2arr_db(SCENE2ARR_DB_FILE).connection.close()
+        self.updates = PVRUpdateQueue(logger, PVRWriter(logger, SCENE2ARR_DB_FILE))
+        self.pvrs = []
+        self.refreshed = None
+        self.known_groups = set()
+        self.data_version = None
+        self.given_up = 0
+
+    def refresh(self):
+        self.logger.debug(f"{VERBOSE} Loading release profiles.")
+        # hand over what we have so far, the writer re-applies it to the reloaded profiles
+        self.updates.flush()
+        self.data_version = self.updates.writer.data_version()
+        self.pvrs = scene2arr.init_pvrs(self.logger)
+        self.updates.writer.set_pvrs(self.pvrs)
+        self.refreshed = time.monotonic()
+        self._update_known_groups()
+
+    def _update_known_groups(self):
+        with self.updates.lock:
+            self.given_up = self.updates.writer.given_up
+            required = [
+                {restriction[1:] for restriction in pvr.required if restriction.startswith("-")}
+                for pvr in self.pvrs
+                if not pvr.skip and pvr.required is not None
+            ]
+        self.known_groups = set.intersection(*required) if required else set()
+        self.logger.debug(f"{VERBOSE} {len(self.known_groups)} groups are required by all instances.")
+
+    def _check(self):
+        if (
+            self.refreshed is None
+            or time.monotonic() - self.refreshed > self.max_age
+            or self.updates.writer.data_version() != self.data_version
+        ):
+            self.refresh()
+        elif self.updates.writer.given_up != self.given_up:
+            # the writer dropped some changes, those groups are missing from the profiles again
+            self._update_known_groups()
+
+    def is_known(self, group_name):
+        """True if every instance already requires -group_name."""
+        with self.lock:
+            self._check()
+            return group_name in self.known_groups
+
+    def add_group(self, group_name):
+        with self.lock:
+            self._check()
+            for pvr in self.pvrs:
+                if pvr.skip or pvr.required is None:
+                    continue
+                if self.updates.add(pvr, group_name):
+                    self.logger.debug(f"{VERBOSE} Queued -{group_name} for {pvr.name}.")
+            if self.pvrs:
+                self.known_groups.add(group_name)
+
+    def run_updates(self):
+        self.updates.stop_event = getattr(self, "stop_event", threading.Event())
+        self.updates.run(self.update_window)
+
+    def close(self):
+        self.updates.close(timeout=10)
+
+
 class ircMessageParser:
-    def __init__(self, channel):
+    # capture groups to extract for each regex, in the order handle_message tries them
+    capture_groups = {
+        "pre_regex": ("section", "release"),
+        "nuke_regex": ("type", "release", "reason", "nukenet"),
+        "info_regex": ("type", "release", "files", "size", "genre"),
+        "addold_regex": ("type", "release", "section", "size", "files", "genre", "timestamp"),
+    }
+
+    # numbered backreferences and conditionals would point to the wrong group in a combined regex,
+    # and global inline flags like (?i) would apply to every branch (Python < 3.11 only warns)
+    unsafe_to_combine_regex = re.compile(r"\\[1-9]|\(\?P=|\(\?\(|\(\?[aiLmsux]+\)")
+
+    def __init__(self, channel, single_pass=False):
         self.channel = channel
+        self.author = channel.get("author", None)
+        # Compile the regexes and resolve their capture groups once per channel,
+        # so parsing a message doesn't have to go through the channel config again
+        self.patterns = {}
+        self.group_indices = {}
+        for regex_key, capture_groups in self.capture_groups.items():
+            regex = channel.get(regex_key, None)
+            if regex is None:
+                continue
+            pattern = re.compile(regex)
+            self.patterns[regex_key] = pattern
+            self.group_indices[regex_key] = {
+                capture_group: self._resolve_group(pattern, channel.get(f"{regex_key}_{capture_group}", None))
+                for capture_group in capture_groups
+            }
+        self.classifier = self._compile_classifier() if single_pass else None
+
+    def _compile_classifier(self):
+        # Combine all regexes of the channel into one alternation with a named branch per regex,
+        # remembering where each branch's capture groups start in the combined regex
+        branches = []
+        self.branch_offsets = {}
+        groups = 0
+        for regex_key, pattern in self.patterns.items():
+            if self.unsafe_to_combine_regex.search(pattern.pattern):
+                return None
+            groups += 1
+            self.branch_offsets[regex_key] = groups
+            groups += pattern.groups
+            branches.append(f"(?P<{regex_key}>{pattern.pattern})")
+        if not branches:
+            return None
+        try:
+            return re.compile("|".join(branches))
+        except re.error:
+            # e.g. duplicate group names, just use the regexes one by one
+            return None
+
+    @staticmethod
+    def _resolve_group(pattern, group):
+        # Return the configured capture group if it exists in the pattern, otherwise None
+        if isinstance(group, str):
+            return group if group in pattern.groupindex else None
+        if isinstance(group, int) and 0 <= group <= pattern.groups:
+            return group
+        return None
 
-    def _parse_message(self, message, regex_key, capture_groups, check_capture_group=False):
-        # Retrieve the regex pattern from the channel configuration
-        regex = self.channel.get(regex_key, None)
+    def _extract(self, match, regex_key, check_capture_group=False, offset=0):
+        result = {}
+        for capture_group, index in self.group_indices[regex_key].items():
+            # Check if the capture group regex is defined if required
+            if check_capture_group and not self.channel.get(f"{regex_key}_{capture_group}", None):
+                continue
+            if index is None:
+                # If the capture group is not found, continue to the next one
+                result[capture_group] = None
+            elif isinstance(index, int):
+                result[capture_group] = match.group(index + offset)
+            else:
+                result[capture_group] = match.group(index)
+        return result
 
-        if regex is None:
+    def _parse_message(self, message, regex_key, check_capture_group=False):
+        pattern = self.patterns.get(regex_key, None)
+        if pattern is None:
             return None
 
-        result = {}
-        match = re.search(regex, message)
-        if match:
-            for capture_group in capture_groups:
-                try:
-                    # Check if the capture group regex is defined if required
-                    if not check_capture_group or self.channel.get(f"{regex_key}_{capture_group}", None):
-                        # Extract the specified capture group
-                        result[capture_group] = match.group(self.channel[f"{regex_key}_{capture_group}"])
-                except IndexError:
-                    # If the capture group is not found, continue to the next one
-                    result[capture_group] = None
-        else:
+        match = pattern.search(message)
+        if not match:
             return None
 
-        return result
+        return self._extract(match, regex_key, check_capture_group)
+
+    def parse(self, message):
+        """Yield (regex_key, result) for every regex of the channel, in the order handle_message
+        tries them. Results are computed lazily, so callers can stop at the first one they accept."""
+        if self.classifier is None:
+            for regex_key in self.patterns:
+                yield regex_key, self._parse_message(message, regex_key)
+            return
+
+        match = self.classifier.search(message)
+        if not match:
+            return
+        kind = match.lastgroup
+        higher_priority = True
+        for regex_key in self.patterns:
+            if regex_key == kind:
+                higher_priority = False
+                yield regex_key, self._extract(match, regex_key, offset=self.branch_offsets[regex_key])
+            elif higher_priority:
+                # A regex tried earlier can only match further to the right than the
+                # classifier did, otherwise its branch would have won the alternation
+                earlier_match = self.patterns[regex_key].search(message, match.start() + 1)
+                yield regex_key, self._extract(earlier_match, regex_key) if earlier_match else None
+            else:
+                yield regex_key, self._parse_message(message, regex_key)
 
     def preparse(self, message):
-        return self._parse_message(message, "pre_regex", ["section", "release"])
+        return self._parse_message(message, "pre_regex")
 
     def nukeparse(self, message):
-        return self._parse_message(message, "nuke_regex", ["type", "release", "reason", "nukenet"])
+        return self._parse_message(message, "nuke_regex")
 
     def infoparse(self, message):
-        return self._parse_message(message, "info_regex", ["type", "release", "files", "size", "genre"])
+        return self._parse_message(message, "info_regex")
     
     def addoldparse(self, message):
-        return self._parse_message(message, "addold_regex", ["type", "release", "section", "size", "files", "genre", "timestamp"])
+        return self._parse_message(message, "addold_regex")
+
+class LRUCache:
+    """Bounded, thread-safe least recently used cache. Entries expire after ttl seconds, if given.
+    Besides maxsize entries, the cache can be limited to max_bytes as measured by sizeof(key, value),
+    which defaults to a shallow sys.getsizeof of both."""
+
+    # pass as default to get() to tell a cached None apart from a miss
+    missing = object()
+
+    def __init__(self, maxsize=1000, ttl=None, max_bytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda key, value: sys.getsizeof(key) + sys.getsizeof(value))
+        self.data = OrderedDict()  # key -> (expiry, value, size)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _store(self, key, value):
+        # call with the lock held
+        expiry = time.monotonic() + self.ttl if self.ttl else None
+        self._remove(key)
+        size = self.sizeof(key, value)
+        self.data[key] = (expiry, value, size)
+        self.bytes += size
+        while self.data and (
+            len(self.data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        ):
+            self.bytes -= self.data.popitem(last=False)[1][2]
+
+    def _remove(self, key):
+        # call with the lock held
+        item = self.data.pop(key, None)
+        if item is not None:
+            self.bytes -= item[2]
+
+    def get(self, key, default=None):
+        with self.lock:
+            item = self.data.get(key, None)
+            if item is not None and item[0] is not None and item[0] < time.monotonic():
+                self._remove(key)
+                item = None
+            if item is None:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self._store(key, value)
+
+    def add(self, key, value=True):
+        """Set key unless it is already cached. Returns False if it was, in one step."""
+        with self.lock:
+            item = self.data.get(key, None)
+            if item is not None and (item[0] is None or item[0] >= time.monotonic()):
+                self.data.move_to_end(key)
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._store(key, value)
+            return True
+
+    def discard(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+class ReleaseParserWorker:
+    def __init__(self, command):
+        self.command = command
+        self.requests = 0
+        self.request_id = 0
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def request(self, payload, timeout):
+        # every answer has to echo its request_id, so a stray line can't shift all later answers
+        self.request_id += 1
+        self.process.stdin.write(json.dumps(dict(payload, request_id=self.request_id)) + "\n")
+        self.process.stdin.flush()
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise TimeoutError(f"No answer from {' '.join(self.command)} within {timeout}s")
+        line = self.process.stdout.readline()
+        if not line:
+            raise EOFError(f"{' '.join(self.command)} exited with code {self.process.poll()}")
+        self.requests += 1
+        data = json.loads(line)
+        if not isinstance(data, dict) or data.pop("request_id", None) != self.request_id:
+            raise ValueError(f"Unexpected answer from {' '.join(self.command)}: {line.strip()}")
+        return data
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+            self.process.wait()
+
+
+class ReleaseParserPool:
+    """Long-lived parserelease_worker.php processes, so a pre doesn't have to boot PHP and
+    load ReleaseParser every time. Dead, hanging or worn-out workers are replaced.
+    Results are cached by (release, section), so every release is parsed only once."""
+
+    def __init__(self, logger, size=2, timeout=10, max_requests=10000, script="parserelease_worker.php", cache_size=5000, cache_ttl=3600, command=None):
+        self.logger = logger
+        self.command = command or ["php", script]
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.restarts = 0
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.pending = {}  # (release, section) -> Future, for releases currently being parsed
+        self.pending_lock = threading.Lock()
+        self.workers = queue.Queue()
+        for _ in range(max(1, size)):
+            self.workers.put(ReleaseParserWorker(self.command))
+
+    def _restart(self, worker, reason):
+        self.logger.warning(f"Restarting release parser worker: {reason}")
+        self.restarts += 1
+        worker.stop()
+        return ReleaseParserWorker(self.command)
+
+    def _request(self, payload):
+        worker = self.workers.get()
+        try:
+            if not worker.is_alive():
+                worker = self._restart(worker, f"exited with code {worker.process.poll()}")
+            elif worker.requests >= self.max_requests:
+                worker = self._restart(worker, f"served {worker.requests} requests")
+            try:
+                return worker.request(payload, self.timeout)
+            except (OSError, EOFError, ValueError) as e:
+                # Give it one more try with a fresh worker before giving up
+                worker = self._restart(worker, e)
+                try:
+                    return worker.request(payload, self.timeout)
+                except (OSError, EOFError, ValueError) as e:
+                    returncode = worker.process.poll() or 1
+                    worker = self._restart(worker, e)
+                    raise subprocess.CalledProcessError(returncode, self.command) from e
+        finally:
+            self.workers.put(worker)
+
+    def parse(self, release_name, section):
+        key = (release_name, section)
+        # If another thread is already parsing the same release, wait for its result
+        with self.pending_lock:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+            future = self.pending.get(key, None)
+            if future is None:
+                future = self.pending[key] = Future()
+            else:
+                return future.result()
+
+        try:
+            data = self._request({"release": release_name, "section": section})
+            if "error" not in data:
+                self.cache.set(key, data)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.pending_lock:
+                del self.pending[key]
+
+    def check_health(self):
+        # Ping every idle worker once, a worker that doesn't answer gets replaced
+        for _ in range(self.workers.qsize()):
+            try:
+                worker = self.workers.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if not worker.is_alive() or worker.request({"ping": True}, self.timeout).get("pong") is not True:
+                    worker = self._restart(worker, "failed health check")
+            except (OSError, EOFError, ValueError) as e:
+                worker = self._restart(worker, e)
+            finally:
+                self.workers.put(worker)
+
+    def stats(self):
+        return {"workers": self.workers.qsize(), "restarts": self.restarts, "cache": self.cache.stats()}
+
+    def run_health_checks(self, interval=60):
+        while not getattr(self, "stop_event", threading.Event()).wait(timeout=interval):
+            try:
+                self.check_health()
+                self.logger.debug(f"{VERBOSE} Release parser: {self.stats()}")
+            except Exception as e:
+                self.logger.error(f"Error checking release parser workers: {e}", exc_info=True)
+
+    def close(self):
+        while True:
+            try:
+                self.workers.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+class PreDBWriter:
+    """Owns the only write connection to pre.db. InputBots and the MetadataAgent submit
+    events with submit(), a single thread applies them in batches and commits once per
+    batch_size events or batch_window seconds, whichever comes first. Each event gets a
+    Future with the handler's result, which tells the caller what to broadcast."""
+
+    def __init__(self, logger, dbname, batch_size=100, batch_window=0.05, recent_size=100000, recent_hours=24, latency_max_delay=600, latency_days=7):
+        self.logger = logger
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.conn = self.connect(dbname)
+        self.events = queue.Queue()
+        # Releases known to be in pre.db, so the copies of a pre announced on other networks
+        # can be dropped without a trip to the writer. A miss just means "ask SQLite".
+        self.recent_pres = LRUCache(maxsize=recent_size)  # release -> time.time() of the first announcement
+        self.recent_hours = recent_hours
+        self.latency_max_delay = latency_max_delay
+        self.latency_days = latency_days
+
+    @staticmethod
+    def connect(dbname, read_only=False):
+        """Open pre.db with the pragmas from conf.py. In WAL mode, read-only connections
+        neither wait for the writer nor hold it up."""
+        if read_only:
+            uri = f"{pathlib.Path(dbname).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(dbname, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in pre_db_pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def submit(self, handler, *args):
+        """Queue handler(cursor, *args) to run inside the writer's transaction."""
+        future = Future()
+        self.events.put((handler, args, future))
+        return future
+
+    def warm(self):
+        since = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) - self.recent_hours * 3600
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT release FROM pre WHERE timestamp >= ? ORDER BY timestamp DESC LIMIT ?",
+                (since, self.recent_pres.maxsize),
+            )
+            releases = [row["release"] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        # oldest first, so the newest releases are the last to be evicted.
+        # We didn't see these arrive, so they don't count towards the latency statistics.
+        for release in reversed(releases):
+            self.recent_pres.add(release, None)
+        self.logger.info(f"{INFO} Loaded {len(releases)} releases from the last {self.recent_hours} hours.")
+
+    def claim_pre(self, release, source, arrival):
+        """True if this is the first announcement of release. Every later announcement that arrives
+        within latency_max_delay seconds of the first is kept as a latency sample for source,
+        the first one by insert_pre once it turned out to be new to pre.db."""
+        if self.recent_pres.add(release, arrival):
+            return True
+        first = self.recent_pres.get(release)
+        if first is not None and arrival - first <= self.latency_max_delay:
+            self.submit(self.insert_latency, release, source, round(arrival - first, 3), int(arrival))
+        return False
+
+    def run_rollups(self, interval=3600):
+        stop_event = getattr(self, "stop_event", threading.Event())
+        while not stop_event.wait(timeout=interval):
+            since = int(datetime.datetime.now(datetime.timezone.utc).timestamp()) - self.latency_days * 86400
+            try:
+                self.submit(self.rollup_latency, since).result()
+            except Exception as e:
+                self.logger.error(f"Error updating pre latency statistics: {e}", exc_info=True)
+
+    def run(self):
+        stop_event = getattr(self, "stop_event", threading.Event())
+        try:
+            self.warm()
+        except sqlite3.Error as error:
+            self.logger.error(f"{ERROR} Could not load recent releases from pre.db: {error}", exc_info=True)
+        # keep going until everything that was submitted before shutdown is written
+        while not stop_event.is_set() or not self.events.empty():
+            try:
+                batch = [self.events.get(timeout=1)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.events.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._apply(batch)
+            except Exception as error:
+                # one bad batch must not end the only writer
+                self.logger.error(f"{ERROR} Could not write {len(batch)} events to pre.db: {error}", exc_info=True)
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                for handler, args, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+        self.conn.close()
+
+    def _apply(self, batch):
+        results = []
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            for handler, args, future in batch:
+                # a failing event only rolls back itself, not the whole batch
+                cursor.execute("SAVEPOINT event")
+                try:
+                    results.append((future, handler(cursor, *args), None))
+                    cursor.execute("RELEASE event")
+                except Exception as error:
+                    cursor.execute("ROLLBACK TO event")
+                    cursor.execute("RELEASE event")
+                    results.append((future, None, error))
+            self.conn.commit()
+        except sqlite3.Error as error:
+            self.logger.error(f"{ERROR} Could not write {len(batch)} events to pre.db: {error}", exc_info=True)
+            self.conn.rollback()
+            results = [(future, None, error) for handler, args, future in batch]
+        finally:
+            cursor.close()
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    # Handlers, run on the writer thread. They return whether there is something to broadcast.
+
+    # Each pre, info and addold event is a single upsert on pre. cursor.rowcount tells whether
+    # it inserted or changed the row, so no SELECT is needed (RETURNING needs SQLite 3.35,
+    # the Debian bullseye image ships 3.34).
+
+    @staticmethod
+    def insert_pre(cursor, result, source, currenttime, arrival=None):
+        cursor.execute(
+            """
+            INSERT INTO pre (release, type, section, source, timestamp)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (release) DO NOTHING
+            """,
+            (
+                result["release"],
+                "PRE",
+                result["section"],
+                source,
+                currenttime,
+            ),
+        )
+        if cursor.rowcount != 1:
+            return False
+        # only a pre that is new to pre.db makes its source the first to announce it
+        if arrival is not None:
+            PreDBWriter.insert_latency(cursor, result["release"], source, 0.0, int(arrival))
+        return True
+
+    @staticmethod
+    def record_nuke(cursor, result, source, currenttime):
+        # predataba.se currently doesn't report modnukes correctly
+        # Check for identical modnuke in database if the message is from irc.predataba.se
+        if source.startswith("irc.predataba.se/"):
+            cursor.execute(
+                """SELECT release FROM nuke 
+                WHERE release=? AND type='MODNUKE' AND reason=? AND nukenet=?""",
+                (
+                    result["release"],
+                    result["reason"],
+                    result["nukenet"],
+                ),
+            )
+            if cursor.fetchone():
+                return False
+
+        # if any other network reports a modnuke, check for identical nukes from predataba.se and update them
+        if result["type"] == 'MODNUKE':
+            cursor.execute(
+                """SELECT release FROM nuke 
+                WHERE release=? AND type='NUKE' AND reason=? AND nukenet=? AND source='irc.predataba.se/#pre'""",
+                (
+                    result["release"],
+                    result["reason"],
+                    result["nukenet"],
+                ),
+            )
+            if cursor.fetchone():
+                cursor.execute(
+                    """UPDATE nuke SET type=?, source=?, timestamp=? 
+                    WHERE release=? AND reason=? AND nukenet=?""",
+                    (
+                        result["type"],
+                        source,
+                        currenttime,
+                        result["release"],
+                        result["reason"],
+                        result["nukenet"],
+                    ),
+                )
+                PreDBWriter.update_nuke_state(cursor, result, source, currenttime)
+                return True
+
+        cursor.execute(
+            """SELECT release, type, reason, nukenet FROM nuke 
+            WHERE release=? AND type=? AND reason=?""",
+            (
+                result["release"],
+                result["type"],
+                result["reason"],
+            ),
+        )
+        row = cursor.fetchone()
+        if not row:
+            cursor.execute(
+                """
+                INSERT INTO nuke (release, type, reason, nukenet, source, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    result["release"],
+                    result["type"],
+                    result["reason"],
+                    result["nukenet"],
+                    source,
+                    currenttime,
+                ),
+            )
+            PreDBWriter.update_nuke_state(cursor, result, source, currenttime)
+            return True
+        if not row["nukenet"]:
+            for table in ("nuke", "nuke_state"):
+                cursor.execute(
+                    f"""
+                    UPDATE {table} SET nukenet=? 
+                    WHERE release=? AND type=? AND reason=?""",
+                    (
+                        result["nukenet"],
+                        result["release"],
+                        result["type"],
+                        result["reason"],
+                    ),
+                )
+        return False
+
+    @staticmethod
+    def update_nuke_state(cursor, result, source, currenttime):
+        # Only replace the current state with something at least as recent
+        cursor.execute(
+            """
+            INSERT INTO nuke_state (release, type, reason, nukenet, source, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (release) DO UPDATE SET
+                type=excluded.type, reason=excluded.reason, nukenet=excluded.nukenet,
+                source=excluded.source, timestamp=excluded.timestamp
+            WHERE excluded.timestamp >= nuke_state.timestamp""",
+            (
+                result["release"],
+                result["type"],
+                result["reason"],
+                result["nukenet"],
+                source,
+                currenttime,
+            ),
+        )
+
+    @staticmethod
+    def record_info(cursor, result, source, currenttime):
+        if result["type"].lower() == "info":
+            # size and files are only filled in if neither is known yet
+            cursor.execute( # TODO: Remove timestamp here, so that a later ADDOLD can add it?
+                """
+                INSERT INTO pre (release, type, size, files, source, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (release) DO UPDATE SET size=excluded.size, files=excluded.files
+                WHERE IFNULL(pre.size, 0) = 0 AND IFNULL(pre.files, 0) = 0""",
+                (
+                    result["release"],
+                    "INFO",
+                    result["size"],
+                    result["files"],
+                    source,
+                    currenttime,
+                ),
+            )
+        elif result["type"].lower() == "genre":
+            # a missing genre or a single character is replaced
+            cursor.execute(
+                """
+                INSERT INTO pre (release, type, genre, source, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (release) DO UPDATE SET genre=excluded.genre
+                WHERE IFNULL(LENGTH(pre.genre), 0) <= 1""",
+                (
+                    result["release"],
+                    "GENRE",
+                    result["genre"],
+                    source,
+                    currenttime,
+                ),
+            )
+        else:
+            return False
+        return cursor.rowcount > 0
+
+    @staticmethod
+    def record_addold(cursor, result, source):
+        # Merge rules for existing releases:
+        # - the section is upgraded from PRE to the real one
+        # - size, files and genre are only filled in when empty
+        # - unless the release was seen as a PRE, the first timestamp is kept and the type becomes ADDOLD
+        cursor.execute(
+            """
+            INSERT INTO pre (release, type, section, size, files, genre, source, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (release) DO UPDATE SET
+                section = CASE WHEN pre.section = 'PRE' AND excluded.section != 'PRE'
+                    THEN excluded.section ELSE pre.section END,
+                size = CASE WHEN IFNULL(pre.size, 0) = 0 AND excluded.size IS NOT NULL
+                    THEN excluded.size ELSE pre.size END,
+                files = CASE WHEN IFNULL(pre.files, 0) = 0 AND excluded.files IS NOT NULL
+                    THEN excluded.files ELSE pre.files END,
+                genre = CASE WHEN IFNULL(pre.genre, '') = '' AND excluded.genre IS NOT NULL
+                    THEN excluded.genre ELSE pre.genre END,
+                timestamp = CASE WHEN IFNULL(pre.type, '') != 'PRE' AND IFNULL(pre.timestamp, 0) = 0 AND excluded.timestamp IS NOT NULL
+                    THEN excluded.timestamp ELSE pre.timestamp END,
+                type = CASE WHEN IFNULL(pre.type, '') != 'PRE'
+                    THEN 'ADDOLD' ELSE pre.type END
+            WHERE (pre.section = 'PRE' AND excluded.section != 'PRE')
+                OR (IFNULL(pre.size, 0) = 0 AND excluded.size IS NOT NULL)
+                OR (IFNULL(pre.files, 0) = 0 AND excluded.files IS NOT NULL)
+                OR (IFNULL(pre.genre, '') = '' AND excluded.genre IS NOT NULL)
+                OR (IFNULL(pre.type, '') != 'PRE' AND IFNULL(pre.timestamp, 0) = 0 AND excluded.timestamp IS NOT NULL)
+                OR IFNULL(pre.type, '') NOT IN ('PRE', 'ADDOLD')""",
+            (
+                result["release"],
+                "ADDOLD",
+                result["section"] if result["section"] and result["section"] != 'None' else None,
+                result["size"] if result["size"] and result["size"] != '0' else None,
+                result["files"] if result["files"] and result["files"] != '0' else None,
+                result["genre"] if result["genre"] and result["genre"] != 'None' else None,
+                source,
+                result["timestamp"] if result["timestamp"] and result["timestamp"] != '0' else None,
+            ),
+        )
+        return False
+
+    @staticmethod
+    def update_infos(cursor, results):
+        # size and files of several releases from srrDB, returns the releases that were updated
+        updated = set()
+        for result in results:
+            cursor.execute(
+                "UPDATE pre SET size=?, files=? WHERE release=? AND (size IS NOT ? OR files IS NOT ?)",
+                (result["size"], result["files"], result["release"], result["size"], result["files"]),
+            )
+            if cursor.rowcount:
+                updated.add(result["release"])
+        return updated
+
+    @staticmethod
+    def insert_latency(cursor, release, source, delay, timestamp):
+        # only the first announcement per source counts
+        cursor.execute(
+            """
+            INSERT INTO pre_latency (release, source, delay, timestamp)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (release, source) DO NOTHING""",
+            (release, source, delay, timestamp),
+        )
+        return False
+
+    @staticmethod
+    def rollup_latency(cursor, since):
+        # Percentiles per source over the samples since then, older samples are dropped
+        cursor.execute("DELETE FROM pre_latency WHERE timestamp < ?", (since,))
+        cursor.execute("SELECT source, delay FROM pre_latency ORDER BY source, delay")
+        delays = {}
+        for row in cursor.fetchall():
+            delays.setdefault(row["source"], []).append(row["delay"])
+        timestamp = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+        cursor.execute("DELETE FROM pre_latency_rollup")
+        cursor.executemany(
+            """
+            INSERT INTO pre_latency_rollup (source, samples, first, p50, p90, p99, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (
+                    source,
+                    len(values),
+                    values.count(0.0),
+                    values[min(len(values) - 1, int(0.5 * len(values)))],
+                    values[min(len(values) - 1, int(0.9 * len(values)))],
+                    values[min(len(values) - 1, int(0.99 * len(values)))],
+                    timestamp,
+                )
+                for source, values in delays.items()
+            ],
+        )
+        return False
+
 
 class IRCBot(irc.bot.SingleServerIRCBot):
     def __init__(
@@ -230,6 +1384,11 @@ class IRCBot(irc.bot.SingleServerIRCBot):
 
 
 class InputBot(IRCBot):
+    # Thanks to ZeroKnight
+    # http://stackoverflow.com/questions/29247659/how-to-remove-all-irc-colour-codes-from-string
+    formatting_regex = re.compile(r"[\x02\x0F\x16\x1D\x1F]|\x03(\d{,2}(,\d{,2})?)?")
+    nuke_or_pre_regex = re.compile(r"(((UN)(DEL)?)|(RE)|(S)|(OLD)|(MOD)|(DEL))((NUKE)|(PRE))", re.IGNORECASE)
+
     def __init__(
         self,
         args,
@@ -243,34 +1402,33 @@ class InputBot(IRCBot):
         ircchannels,
         nickserv,
         nickserv_command,
-        output_bots,
+        event_bus,
         metadata_agent,
-        lock,
+        pre_writer,
+        release_parser,
+        pvr_manager,
         password=None,
     ):
         super().__init__(args, logger, name, server, port, ssl_enabled, nickname, realname, ircchannels, nickserv, nickserv_command, password)
         self.args = args
         self.logger = logger
-        self.output_bots = output_bots
+        self.event_bus = event_bus
         self.metadata_agent = metadata_agent
-        self.lock = lock
+        self.pre_writer = pre_writer
+        self.release_parser = release_parser
+        self.pvr_manager = pvr_manager
+
+        # Parser registry, built once: compiled regexes, capture groups and author filter per channel
+        self.parsers = {
+            channel["name"].lower(): ircMessageParser(channel, single_pass=irc_single_pass_classifier)
+            for channel in ircchannels
+        }
 
+        # pre.db is written by the PreDBWriter thread, its results come back through this queue
+        self.results = queue.Queue()
         if args["predb"]:
-            with sqlite3.connect(os.getenv("PRE_DB_FILE"), check_same_thread=False) as conn:
-                self.conn = conn
-                self.conn.row_factory = sqlite3.Row
-
-        # we want a shared lock for all threads, so it is actually created outside of this class
-        #try:
-        #    self.lock
-        #except NameError:
-        #    self.lock = threading.Lock()
+            self.reactor.scheduler.execute_every(0.1, self.process_results)
 
-    def disconnect(self, msg="Goodbye, cruel world!"):
-        if self.args["predb"]:
-            self.conn.close()
-        super().disconnect(msg)
-    
     def on_privmsg(self, c, e):
         self.handle_message(c, e)
 
@@ -280,68 +1438,65 @@ class InputBot(IRCBot):
     def handle_message(self, c, e):
         try:
             message = e.arguments[0]
-            # Thanks to ZeroKnight
-            # http://stackoverflow.com/questions/29247659/how-to-remove-all-irc-colour-codes-from-string
-            message = re.sub(
-                r"[\x02\x0F\x16\x1D\x1F]|\x03(\d{,2}(,\d{,2})?)?", "", message
-            )
+            message = self.formatting_regex.sub("", message)
             currenttime = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
             self.logger.info(f"{INFO} {c.server}/{e.target} - {e.source.nick}: {message}")
             matched = False
-            for channel in self.ircchannels:
-                if e.target.lower() == channel["name"].lower():
-                    author = channel.get("author", None)
-                    if author is None or author == e.source.nick:
-                        if re.search(
-                            r"(((UN)(DEL)?)|(RE)|(S)|(OLD)|(MOD)|(DEL))((NUKE)|(PRE))",
-                            message,
-                            re.IGNORECASE,
-                        ):
-                            self.logger.info(f"{INFO} {c.server}/{e.target} - {message}")
-                        regexes = ("pre_regex", "nuke_regex", "info_regex", "addold_regex")
-                        parser = ircMessageParser(channel)
-                        for current_regex in regexes:
-                            if current_regex == "pre_regex":
-                                if self.args["predb"]:
-                                    if self.process_pre_regex(c, e, message, parser, currenttime):
-                                        matched = True
-                                        break
-                                if self.args["irc"]:
-                                    self.add_to_arr(c, e, message, parser)
-                            elif current_regex == "info_regex" and self.args["predb"]:
-                                if self.process_info_regex(c, e, message, parser, currenttime, False):
-                                    matched = True
-                                    break
-                            elif current_regex == "nuke_regex" and self.args["predb"]:
-                                if self.process_nuke_regex(c, e, message, parser, currenttime):
-                                    matched = True
-                                    break
-                            elif current_regex == "addold_regex" and self.args["predb"]:
-                                if self.process_addold_regex(c, e, message, parser):
-                                    matched = True
-                                    break
-                        if not matched:
-                            with open("unmatched_messages.log", "a") as log_file:
-                                log_file.write(f"{datetime.datetime.now(datetime.timezone.utc)} - {c.server}/{e.target} - {e.source.nick}: {message}\n")
+            parser = self.parsers.get(e.target.lower(), None)
+            if parser is not None and (parser.author is None or parser.author == e.source.nick):
+                # the single pass classifier already tells pre and nuke messages apart
+                if parser.classifier is None and self.nuke_or_pre_regex.search(message):
+                    self.logger.info(f"{INFO} {c.server}/{e.target} - {message}")
+                for current_regex, result in parser.parse(message):
+                    if current_regex == "pre_regex":
+                        if self.args["predb"]:
+                            if self.process_pre_regex(c, e, message, result, currenttime):
+                                matched = True
+                                break
+                        if self.args["irc"]:
+                            self.add_to_arr(c, e, message, result)
+                    elif current_regex == "info_regex" and self.args["predb"]:
+                        if self.process_info_regex(c, e, message, result, currenttime, False):
+                            matched = True
+                            break
+                    elif current_regex == "nuke_regex" and self.args["predb"]:
+                        if self.process_nuke_regex(c, e, message, result, currenttime):
+                            matched = True
+                            break
+                    elif current_regex == "addold_regex" and self.args["predb"]:
+                        if self.process_addold_regex(c, e, message, result):
+                            matched = True
+                            break
+                if not matched:
+                    with open("unmatched_messages.log", "a") as log_file:
+                        log_file.write(f"{datetime.datetime.now(datetime.timezone.utc)} - {c.server}/{e.target} - {e.source.nick}: {message}\n")
         except Exception as exc:
             exc_info = (type(exc), exc, exc.__traceback__)
             self.logger.error(f"{c.server}/{e.target} - {message}", exc_info=exc_info)
 
-    def add_to_arr(self, c, e, message, parser):
-        result = parser.preparse(message)
-        if not result or any(value is None for value in result.values()):
-            return
-        release_name = result["release"]
-        section = result["section"]
-        # Call the PHP script to get the type of release
+    def parse_release(self, release_name, section):
+        # Ask the PHP ReleaseParser for type, group, format etc. of the release
         try:
-            output = subprocess.check_output(['php', 'parserelease.php', release_name, section], text=True).strip()
-            data = json.loads(output)
+            return self.release_parser.parse(release_name, section)
         except subprocess.CalledProcessError as e:
             self.logger.critical(f"Error calling PHP script: {e}", exc_info=True)
             exit(1)
         except json.JSONDecodeError as e:
             self.logger.error(f"Error decoding JSON output: {e}", exc_info=True)
+        except Exception as e:
+            self.logger.error(f"{ERROR}: {Exception} - {e}", exc_info=True)
+        return None
+
+    def add_to_arr(self, c, e, message, result):
+        if not result or any(value is None for value in result.values()):
+            return
+        release_name = result["release"]
+        section = result["section"]
+        # Most pres come from groups we already have, skip those before parsing
+        if "-" in release_name and self.pvr_manager.is_known(release_name.rsplit("-", 1)[1]):
+            return
+        data = self.parse_release(release_name, section)
+        if data is None:
             return
         
         # Discard irrelevant releases
@@ -371,75 +1526,73 @@ class InputBot(IRCBot):
             return
 
         group_name = data.get("group")
+        if not group_name or self.pvr_manager.is_known(group_name):
+            return
         self.logger.info(f"Adding {group_name} to *arr instances.")
-        scene2arr.main({"add": True, "group": group_name, "remove": False, "xrel": False, "irc": False, "predb": False, "verbose": self.args["verbose"]})
-        # TODO: suppress repeated messages
+        self.pvr_manager.add_group(group_name)
     
-    def process_pre_regex(self, c, e, message, parser, currenttime):
-        result = parser.preparse(message)
+    def write(self, c, e, message, handler, *args, callback=None):
+        # Hand the event to the pre.db writer, callback gets the handler's result on this bot's reactor thread
+        future = self.pre_writer.submit(handler, *args)
+        future.add_done_callback(lambda future: self.results.put((c, e, message, future, callback)))
+        return future
+
+    def process_results(self):
+        while True:
+            try:
+                c, e, message, future, callback = self.results.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = future.result()
+                if callback is not None:
+                    callback(result)
+            except sqlite3.Error as error:
+                self.logger.error(f"{c.server}/{e.target} - {error} - {message}", exc_info=True)
+            except Exception as exc:
+                exc_info = (type(exc), exc, exc.__traceback__)
+                self.logger.error(f"{c.server}/{e.target} - {message}", exc_info=exc_info)
+
+    def process_pre_regex(self, c, e, message, result, currenttime):
         if not result or not result["release"] or not result["section"]:
             return False
-        parsed_release = None
-        try:
-            self.lock.acquire()
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "SELECT release FROM pre WHERE release=?",
-                (result["release"],),
-            )
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute(
-                    """
-                    INSERT INTO pre (release, type, section, source, timestamp)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        result["release"],
-                        "PRE",
-                        result["section"],
-                        f"{c.server}/{e.target}",
-                        currenttime,
-                    ),
-                )
-                self.conn.commit()
+        # the same pre is announced on several networks within seconds
+        arrival = time.time()
+        if not self.pre_writer.claim_pre(result["release"], f"{c.server}/{e.target}", arrival):
+            return True
+        future = self.write(
+            c, e, message,
+            self.pre_writer.insert_pre, result, f"{c.server}/{e.target}", currenttime, arrival,
+            callback=lambda inserted: inserted and self.announce_pre(c, e, result, currenttime),
+        )
+        # if it couldn't be stored, the next copy should get another chance
+        future.add_done_callback(lambda future: future.exception() and self.pre_writer.recent_pres.discard(result["release"]))
+        return True
 
-                try:
-                    output = subprocess.check_output(['php', 'parserelease.php', result["release"], result["section"]], text=True).strip()
-                    parsed_release = json.loads(output)
-                except subprocess.CalledProcessError as e:
-                    self.logger.critical(f"Error calling PHP script: {e}", exc_info=True)
-                    exit(1)
-                except json.JSONDecodeError as e:
-                    self.logger.error(f"Error decoding JSON output: {e}", exc_info=True)
-                    return
-                except Exception as e:
-                    self.logger.error(f"{ERROR}: {Exception} - {e}", exc_info=True)
-                    return  
+    def announce_pre(self, c, e, result, currenttime):
+        parsed_release = self.parse_release(result["release"], result["section"])
+        if parsed_release is None:
+            return
 
-                self.broadcast("pre", result, parsed_release)  # Notify the Broadcaster
-        except sqlite3.Error as error:
-            self.logger.error(f"{c.server}/{e.target} - {error} - {message}", exc_info=True)
-        finally:
-            cursor.close()
-            self.lock.release()
-        
-        if not row and parsed_release:
-            # Determine genre using MetadataAgent
-            genres = self.metadata_agent.determine_genre(parsed_release)
-            if genres:
-                genre_string = '/'.join(genres)
-                genre_message = {
-                    "type": "GENRE",
-                    "release": result["release"],
-                    "genre": genre_string
-                }
-                self.process_info_regex(c, e, genre_message, parser, currenttime, True)
-        
-        return True
+        self.broadcast("pre", result, parsed_release)  # Notify the Broadcaster
 
-    def process_nuke_regex(self, c, e, message, parser, currenttime):
-        result = parser.nukeparse(message)
+        # Determine genre using MetadataAgent, its workers do the HTTP calls so this thread can keep reading
+        self.metadata_agent.submit_genre(
+            parsed_release, lambda genres: self.announce_genre(c, e, result, genres, currenttime)
+        )
+
+    def announce_genre(self, c, e, result, genres, currenttime):
+        # runs on a MetadataAgent worker, process_info_regex hands the broadcast back to this bot
+        if genres:
+            genre_string = '/'.join(genres)
+            genre_message = {
+                "type": "GENRE",
+                "release": result["release"],
+                "genre": genre_string
+            }
+            self.process_info_regex(c, e, genre_message, None, currenttime, True)
+
+    def process_nuke_regex(self, c, e, message, result, currenttime):
         #print(result)
         if not result or not result["release"] or not result["type"] or not result["reason"]:
             return False
@@ -447,106 +1600,15 @@ class InputBot(IRCBot):
         # Convert type to uppercase
         result["type"] = result["type"].upper()
 
-        try:
-            self.lock.acquire()
-            cursor = self.conn.cursor()
-
-            # predataba.se currently doesn't report modnukes correctly
-            # Check for identical modnuke in database if server is irc.predataba.se
-            if c.server == 'irc.predataba.se':
-                cursor.execute(
-                    """SELECT release FROM nuke 
-                    WHERE release=? AND type='MODNUKE' AND reason=? AND nukenet=?""",
-                    (
-                        result["release"],
-                        result["reason"],
-                        result["nukenet"],
-                    ),
-                )
-                row = cursor.fetchone()
-                if row:
-                    return False
-
-            # if any other network reports a modnuke, check for identical nukes from predataba.se and update them
-            if result["type"] == 'MODNUKE':
-                cursor.execute(
-                    """SELECT release FROM nuke 
-                    WHERE release=? AND type='NUKE' AND reason=? AND nukenet=? AND source='irc.predataba.se/#pre'""",
-                    (
-                        result["release"],
-                        result["reason"],
-                        result["nukenet"],
-                    ),
-                )
-                row = cursor.fetchone()
-                if row:
-                    cursor.execute(
-                        """UPDATE nuke SET type=?, source=?, timestamp=? 
-                        WHERE release=? AND reason=? AND nukenet=?""",
-                        (
-                            result["type"],
-                            f"{c.server}/{e.target}",
-                            currenttime,
-                            result["release"],
-                            result["reason"],
-                            result["nukenet"],
-                        ),
-                    )
-                    self.conn.commit()
-                    self.broadcast("nuke", result)  # Notify the Broadcaster
-                    return True
-
-            cursor.execute(
-                """SELECT release, type, reason, nukenet FROM nuke 
-                WHERE release=? AND type=? AND reason=?""",
-                (
-                    result["release"],
-                    result["type"],
-                    result["reason"],
-                ),
-            )
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute(
-                    """
-                    INSERT INTO nuke (release, type, reason, nukenet, source, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        result["release"],
-                        result["type"],
-                        result["reason"],
-                        result["nukenet"],
-                        f"{c.server}/{e.target}",
-                        currenttime,
-                    ),
-                )
-                self.broadcast("nuke", result)  # Notify the Broadcaster
-            else:
-                if not row["nukenet"]:
-                    cursor.execute(
-                        """
-                        UPDATE nuke SET nukenet=? 
-                        WHERE release=? AND type=? AND reason=?""",
-                        (
-                            result["nukenet"],
-                            result["release"],
-                            result["type"],
-                            result["reason"],
-                        ),
-                    )
-            self.conn.commit()
-        except sqlite3.Error as error:
-            self.logger.error(f"{c.server}/{e.target} - {error} - {message}", exc_info=True)
-        finally:
-            cursor.close()
-            self.lock.release()
+        self.write(
+            c, e, message,
+            self.pre_writer.record_nuke, result, f"{c.server}/{e.target}", currenttime,
+            callback=lambda changed: changed and self.broadcast("nuke", result),  # Notify the Broadcaster
+        )
         return True
 
-    def process_info_regex(self, c, e, message, parser, currenttime, skip_parse=False):
-        result = {}
+    def process_info_regex(self, c, e, message, result, currenttime, skip_parse=False):
         if not skip_parse:
-            result = parser.infoparse(message)
             if not result or not result["release"] or not result["type"]:
                 return False
             # since we're generating our own genre information, we'll disregard genre messages from IRC
@@ -555,156 +1617,71 @@ class InputBot(IRCBot):
             result["size"] = round(float(result["size"])) if result["size"] else None
             result["files"] = int(result["files"]) if result["files"] else None
         elif skip_parse:
+            result = {}
             result["type"] = message.get("type")
             result["release"] = message.get("release")
             result["files"] = message.get("files")
             result["size"] = message.get("size")
             result["genre"] = message.get("genre")
 
-        try:
-            self.lock.acquire()
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "SELECT release, size, files, genre FROM pre WHERE release=?",
-                (result["release"],),
-            )
-            row = cursor.fetchone()
-            if not row:
-                if result["type"].lower() == "info":
-                    cursor.execute( # TODO: Remove timestamp here, so that a later ADDOLD can add it?
-                        """
-                        INSERT INTO pre (release, type, size, files, source, timestamp)
-                        VALUES (?, ?, ?, ?, ?, ?)""",
-                        (
-                            result["release"],
-                            "INFO",
-                            result["size"],
-                            result["files"],
-                            f"{c.server}/{e.target}",
-                            currenttime,
-                        ),
-                    )
-                    self.broadcast("info", result)  # Notify the Broadcaster
-                if result["type"].lower() == "genre":
-                    cursor.execute(
-                        """
-                        INSERT INTO pre (release, type, genre, source, timestamp)
-                        VALUES (?, ?, ?, ?, ?)""",
-                        (
-                            result["release"],
-                            "GENRE",
-                            result["genre"],
-                            f"{c.server}/{e.target}",
-                            currenttime,
-                        ),
-                    )
-                    self.broadcast("info", result)  # Notify the Broadcaster
-            else:
-                if not row["genre"] or len(row["genre"]) == 1:
-                    if result["type"].lower() == "genre":
-                        cursor.execute(
-                            "UPDATE pre SET genre=? WHERE release=?",
-                            (
-                                result["genre"],
-                                result["release"],
-                            ),
-                        )
-                        self.broadcast("info", result)  # Notify the Broadcaster
-                if not row["size"] and not row["files"]:
-                    if result["type"].lower() == "info":
-                        cursor.execute(
-                            "UPDATE pre SET size=?, files=? WHERE release=?",
-                            (
-                                result["size"],
-                                result["files"],
-                                result["release"],
-                            ),
-                        )
-                        self.broadcast("info", result)  # Notify the Broadcaster
-            self.conn.commit()
-        except sqlite3.Error as error:
-            self.logger.error(f"{c.server}/{e.target} - {error} - {message}", exc_info=True)
-        finally:
-            cursor.close()
-            self.lock.release()
+        self.write(
+            c, e, message,
+            self.pre_writer.record_info, result, f"{c.server}/{e.target}", currenttime,
+            callback=lambda changed: changed and self.broadcast("info", result),  # Notify the Broadcaster
+        )
         return True
 
-    def process_addold_regex(self, c, e, message, parser):
-        result = parser.addoldparse(message)
+    def process_addold_regex(self, c, e, message, result):
         #print(result)
         if not result or not result["release"] or not result["section"]:
             return False
         
         result["size"] = round(float(result["size"])) if result["size"] else None
 
-        try:
-            self.lock.acquire()
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "SELECT release, type, section, size, files, genre, timestamp FROM pre WHERE release=?",
-                (result["release"],),
-            )
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute(
-                    """
-                    INSERT INTO pre (release, type, section, size, files, genre, source, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        result["release"],
-                        "ADDOLD",
-                        result["section"] if result["section"] and result["section"] != 'None' else None,
-                        result["size"] if result["size"] and result["size"] != '0' else None,
-                        result["files"] if result["files"] and result["files"] != '0' else None,
-                        result["genre"] if result["genre"] and result["genre"] != 'None' else None,
-                        f"{c.server}/{e.target}",
-                        result["timestamp"] if result["timestamp"] and result["timestamp"] != '0' else None,
-                    ),
-                )
-            else:
-                update_fields = []
-                update_values = []
-
-                if row["section"] == 'PRE' and result["section"] and result["section"] != 'PRE' and result["section"] != 'None':
-                    update_fields.append("section = ?")
-                    update_values.append(result["section"])
-
-                if not row["size"] and result["size"] and result["size"] != '0':
-                    update_fields.append("size = ?")
-                    update_values.append(result["size"])
-
-                if not row["files"] and result["files"] and result["files"] != '0':
-                    update_fields.append("files = ?")
-                    update_values.append(result["files"])
-
-                if not row["genre"] and result["genre"] and result["genre"] != 'None':
-                    update_fields.append("genre = ?")
-                    update_values.append(result["genre"])
-                
-                if row["type"] != 'PRE' and not row["timestamp"] and result["timestamp"] and result["timestamp"] != '0':
-                    update_fields.append("timestamp = ?")
-                    update_values.append(result["timestamp"])
-                
-                if row["type"] != 'PRE':
-                    update_fields.append("type = ?")
-                    update_values.append("ADDOLD")
-
-                if update_fields:
-                    update_query = f"UPDATE pre SET {', '.join(update_fields)} WHERE release = ?"
-                    update_values.append(result["release"])
-                    cursor.execute(update_query, update_values)
-
-            self.conn.commit()
-        except sqlite3.Error as error:
-            self.logger.error(f"{c.server}/{e.target} - {error} - {message}", exc_info=True)
-        finally:
-            cursor.close()
-            self.lock.release()
+        self.write(c, e, message, self.pre_writer.record_addold, result, f"{c.server}/{e.target}")
         return True
         
     def broadcast(self, message_type, data, parsed_release=None):
-        for bot in self.output_bots:
-            bot.broadcast(message_type, data, parsed_release)
+        self.event_bus.publish(message_type, data, parsed_release)
+
+# what InputBot and MetadataAgent publish: message is the encoded JSON, and INFO events for the
+# same release and type share a merge_key
+Event = namedtuple("Event", ["type", "message", "merge_key", "published"])
+
+class EventBus:
+    """Hands pres, nukes and infos from InputBots and the MetadataAgent to the OutputBots.
+    Every subscriber queues events on its own (see OutputBot.deliver), so publishing returns
+    right away and a slow output server only holds up itself."""
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, subscriber):
+        with self.lock:
+            self.subscribers = self.subscribers + [subscriber]
+
+    def publish(self, message_type, data, parsed_release=None):
+        subscribers = self.subscribers
+        if not subscribers:
+            return
+        # encoded once for all subscribers, and data isn't touched
+        event = Event(
+            message_type,
+            OutputBot.encode(message_type, data, parsed_release),
+            (data.get("release"), data.get("type")) if message_type == "info" else None,
+            time.monotonic(),
+        )
+        for subscriber in subscribers:
+            try:
+                subscriber.deliver(event)
+            except Exception as e:
+                self.logger.error(f"{ERROR} delivering {message_type} to {getattr(subscriber, 'name', subscriber)}: {e}", exc_info=True)
+        with self.lock:
+            self.published += 1
+
 
 class OutputBot(IRCBot):
     def __init__(
@@ -721,23 +1698,37 @@ class OutputBot(IRCBot):
         nickserv,
         nickserv_command,
         password=None,
+        send_rate=1.0,
+        send_burst=5,
+        queue_size=1000,
+        info_backlog=100,
     ):
         super().__init__(args, logger, name, host, port, ssl_enabled, nickname, realname, ircchannels, nickserv, nickserv_command, password)
         self.pre_channels = [channel["name"] for channel in ircchannels if channel["type"] == "pre"]
         self.nuke_channels = [channel["name"] for channel in ircchannels if channel["type"] == "nuke"]
         self.info_channels = [channel["name"] for channel in ircchannels if channel["type"] == "info"]
+        # Messages are sent by run_sender(), at most send_rate lines per second (bursts of
+        # send_burst), so the server doesn't kick us for flooding. Queued INFO messages are
+        # replaced by newer ones for the same release and dropped once info_backlog messages wait.
+        self.pace = TokenBucket(send_rate, send_burst)
+        self.queue_size = queue_size
+        self.info_backlog = info_backlog
+        self.outbox = deque()  # [enqueued, message_type, message, merge_key]
+        self.queued_info = {}  # merge_key -> outbox entry
+        self.outbox_lock = threading.Condition()
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.latency_total = 0
+        self.latency_max = 0
         self.logger.info(f"OutputBot {name} initialized with channels: {ircchannels}")
 
-        # TODO: Currently we spin up a new instance for every output_server - not ideal!
-        self.musicbrainz_client = MusicBrainzClient()
-        self.omdb_client = OMDBClient(os.getenv("OMDB_APIKEY", ""))
-
-
     def start(self):
         self.logger.info(f"OutputBot {self.name} starting...")
         super().start()
 
-    def determine_section(self, data):
+    @staticmethod
+    def determine_section(data):
         if data["type"] == "ABook":
             return "AUDiOBOOKS"
         elif data["type"] == "Anime":
@@ -801,15 +1792,12 @@ class OutputBot(IRCBot):
         #else:
         return "PRE"
 
-    def broadcast(self, message_type, data, parsed_release=None):
-        channels = []
+    @staticmethod
+    def encode(message_type, data, parsed_release=None):
+        data = dict(data)
         if message_type == "pre":
-            channels = self.pre_channels
-            data["section"] = self.determine_section(parsed_release)
-        elif message_type == "nuke":
-            channels = self.nuke_channels
+            data["section"] = OutputBot.determine_section(parsed_release)
         elif message_type == "info":
-            channels = self.info_channels
             if data["type"] == "GENRE" and data["genre"]:
                 data["genre"] = data["genre"].split('/')
             #elif data["type"] == "GENRE" and not data["genre"]:
@@ -821,34 +1809,282 @@ class OutputBot(IRCBot):
             if value is not None:
                 filtered_data[key] = value
 
-        message = json.dumps(filtered_data)
-        for channel in channels:
-            try:
-                self.connection.privmsg(channel, message)
-                self.logger.info(f"OutputBot {self.name} sent message to {channel}: {message}")
-            # TODO: Handle reconnections gracefully
-            #except irc.client.ServerNotConnectedError:
-            #    pass
-            except Exception as e:
-                self.logger.error(f"Error sending message to {channel}: {e}", exc_info=True)
+        return json.dumps(filtered_data)
+
+    def deliver(self, event):
+        """Queue event for the channels of its type. Called by the EventBus, never blocks."""
+        message_type, message, merge_key = event.type, event.message, event.merge_key
+        with self.outbox_lock:
+            if merge_key is not None:
+                entry = self.queued_info.get(merge_key)
+                if entry is not None:
+                    entry[2] = message  # newer INFO for the same release, keep its place
+                    self.merged += 1
+                    return
+                if len(self.outbox) >= self.info_backlog:
+                    self.dropped += 1
+                    self.logger.debug(f"{VERBOSE} OutputBot {self.name} is behind, dropping {message}")
+                    return
+            if len(self.outbox) >= self.queue_size:
+                stale = self.outbox.popleft()
+                self.queued_info.pop(stale[3], None)
+                self.dropped += 1
+                self.logger.error(f"{ERROR} OutputBot {self.name} queue is full, dropping {stale[2]}")
+            entry = [event.published, message_type, message, merge_key]
+            self.outbox.append(entry)
+            if merge_key is not None:
+                self.queued_info[merge_key] = entry
+            self.outbox_lock.notify()
+
+    def run_sender(self):
+        stop_event = getattr(self, "stop_event", threading.Event())
+        channels = {"pre": self.pre_channels, "nuke": self.nuke_channels, "info": self.info_channels}
+        reported = time.monotonic()
+        while not stop_event.is_set():
+            if time.monotonic() - reported >= 300:
+                self.logger.debug(f"{VERBOSE} OutputBot {self.name} queue: {self.stats()}")
+                reported = time.monotonic()
+            # messages wait for the connection instead of getting lost
+            if not self.connection.is_connected():
+                stop_event.wait(timeout=1)
+                continue
+            with self.outbox_lock:
+                if not self.outbox:
+                    self.outbox_lock.wait(timeout=1)
+                    continue
+                entry = self.outbox.popleft()
+                if self.queued_info.get(entry[3]) is entry:
+                    del self.queued_info[entry[3]]
+                enqueued, message_type, message = entry[:3]
+            latency = time.monotonic() - enqueued
+            for channel in channels[message_type]:
+                stop_event.wait(timeout=self.pace.wait_time())
+                self.pace.try_acquire()
+                try:
+                    self.connection.privmsg(channel, message)
+                    self.logger.info(f"OutputBot {self.name} sent message to {channel}: {message}")
+                except Exception as e:
+                    self.logger.error(f"Error sending message to {channel}: {e}", exc_info=True)
+            with self.outbox_lock:
+                self.sent += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+
+    def stats(self):
+        with self.outbox_lock:
+            return {
+                "queued": len(self.outbox),
+                "sent": self.sent,
+                "merged": self.merged,
+                "dropped": self.dropped,
+                "latency_avg": round(self.latency_total / self.sent, 3) if self.sent else None,
+                "latency_max": round(self.latency_max, 3),
+            }
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class TokenBucket:
+    """Allows rate tokens per second on average, and bursts of up to capacity tokens.
+    Not thread-safe on its own."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def try_acquire(self, tokens=1):
+        if self.refill() < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def wait_time(self, tokens=1):
+        """Seconds until tokens are available."""
+        return max(0, (tokens - self.refill()) / self.rate)
+
+
+class RateLimiter:
+    """Token buckets per API provider, shared by the metadata clients. limits maps a provider
+    to a list of (requests, seconds) windows, a request needs a token from each of them."""
+
+    def __init__(self, limits):
+        self.buckets = {
+            provider: [TokenBucket(requests / seconds, requests) for requests, seconds in windows]
+            for provider, windows in limits.items()
+        }
+        self.lock = threading.Lock()
+        self.allowed = {}
+        self.denied = {}
+
+    def _take(self, provider):
+        # call with the lock held, returns 0 if a token was taken, else the seconds until there is one
+        buckets = self.buckets.get(provider, [])
+        now = time.monotonic()
+        if all(bucket.refill(now) >= 1 for bucket in buckets):
+            for bucket in buckets:
+                bucket.tokens -= 1
+            self.allowed[provider] = self.allowed.get(provider, 0) + 1
+            return 0
+        return max(bucket.wait_time() for bucket in buckets)
+
+    def try_acquire(self, provider):
+        with self.lock:
+            if self._take(provider) == 0:
+                return True
+            self.denied[provider] = self.denied.get(provider, 0) + 1
+            return False
+
+    def acquire(self, provider, max_wait=0):
+        """Take a token for provider, waiting up to max_wait seconds for one. Raises
+        RateLimitExceeded if there is none by then."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self.lock:
+                wait = self._take(provider)
+                if wait == 0:
+                    return
+                if time.monotonic() + wait > deadline:
+                    self.denied[provider] = self.denied.get(provider, 0) + 1
+                    raise RateLimitExceeded(provider)
+            time.sleep(wait)
+
+    def stats(self):
+        with self.lock:
+            return {
+                provider: {"allowed": self.allowed.get(provider, 0), "denied": self.denied.get(provider, 0)}
+                for provider in self.buckets
+            }
+
+
+class MetadataCache:
+    """Answers of the metadata APIs, kept on disk so a restart doesn't ask for the same titles
+    again. Keyed by (provider, normalized title, year, language, region). Answers without
+    genres are kept for miss_ttl seconds, the others for hit_ttl. Beyond max_entries, the
+    least recently used entries are dropped. The access time on disk is only updated when it
+    is more than touch_interval seconds old, so most reads don't cost a write."""
+
+    # returned by get() when there is no usable entry, None is a cached miss
+    missing = object()
+
+    def __init__(
+        self, dbname, hit_ttl=2592000, miss_ttl=86400, max_entries=100000, memory_size=2000, memory_bytes=4194304,
+        touch_interval=3600,
+    ):
+        self.hit_ttl = hit_ttl
+        self.miss_ttl = miss_ttl
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        # recently used answers stay in memory as (expires, value), sized by their JSON
+        self.memory = LRUCache(
+            memory_size, max_bytes=memory_bytes, sizeof=lambda key, item: len(key[1]) + len(json.dumps(item[1]))
+        )
+        self.conn = sqlite3.connect(dbname, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS metadata_cache (
+                provider TEXT,
+                key TEXT,
+                value TEXT,
+                expires INTEGER,
+                accessed INTEGER,
+                PRIMARY KEY (provider, key)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS metadata_cache_accessed ON metadata_cache (accessed)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @staticmethod
+    def key(title, year=None, language=None, region=None):
+        return json.dumps([title, year, language, region])
+
+    def get(self, provider, title, year=None, language=None, region=None):
+        key = self.key(title, year, language, region)
+        now = int(time.time())
+        item = self.memory.get((provider, key))
+        if item is not None and item[0] > now:
+            with self.lock:
+                self.hits += 1
+            return item[1]
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, expires, accessed FROM metadata_cache WHERE provider=? AND key=? AND expires > ?",
+                (provider, key, now),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return self.missing
+            self.hits += 1
+            if now - row[2] >= self.touch_interval:
+                self.conn.execute(
+                    "UPDATE metadata_cache SET accessed=? WHERE provider=? AND key=?", (now, provider, key)
+                )
+                self.conn.commit()
+        value = json.loads(row[0])
+        self.memory.set((provider, key), (row[1], value))
+        return value
+
+    def set(self, provider, title, value, year=None, language=None, region=None, ttl=None):
+        now = int(time.time())
+        if ttl is None:
+            ttl = self.hit_ttl if value else self.miss_ttl
+        expires = now + ttl
+        key = self.key(title, year, language, region)
+        self.memory.set((provider, key), (expires, value))
+        with self.lock:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO metadata_cache (provider, key, value, expires, accessed)
+                VALUES (?, ?, ?, ?, ?)""",
+                (provider, key, json.dumps(value), expires, now),
+            )
+            self.writes += 1
+            # check the size every now and then, not on every write
+            if self.writes % 100 == 0:
+                self.conn.execute("DELETE FROM metadata_cache WHERE expires <= ?", (now,))
+                self.conn.execute(
+                    """DELETE FROM metadata_cache WHERE rowid IN (
+                        SELECT rowid FROM metadata_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_entries,),
+                )
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM metadata_cache").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "size": size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "memory": self.memory.stats(),
+            }
+
 
 class MusicBrainzClient:
-    def __init__(self):
+    # a lookup takes up to three requests, at one per second they have to wait for each other
+    max_wait = 2
+
+    def __init__(self, limiter=None, cache=None):
         self.base_url = "https://musicbrainz.org/ws/2/"
         self.headers = {"User-Agent": "pySceneTools/dev (dotmatrix @t riseup.net)"}
-        self.api_hits = deque()
-
-    def log_api_hits(self):
-        now = time.time()
-        # Remove hits older than 24 hours
-        while self.api_hits and self.api_hits[0] < now - 86400:
-            self.api_hits.popleft()
-        hits_last_24h = len(self.api_hits)
-        
-        # Count hits in the last hour
-        hits_last_hour = sum(1 for hit in self.api_hits if hit >= now - 3600)
-        
-        print(f"MusicBrainz API hits in the last 24 hours: {hits_last_24h} - in the last hour: {hits_last_hour}")
+        self.limiter = limiter or RateLimiter(metadata_rate_limits)
+        self.cache = cache or MetadataCache(":memory:")
+        self.session = http_session()
 
     def normalize_title(self, title):
         # Normalize title by removing non-word characters, removing double spaces,
@@ -861,31 +2097,37 @@ class MusicBrainzClient:
         return title
 
     def search_artist(self, artist_name):
-        self.api_hits.append(time.time())
-        self.log_api_hits()
+        self.limiter.acquire("musicbrainz", max_wait=self.max_wait)
         url = f"{self.base_url}artist/"
         params = {
             "query": artist_name,
             "fmt": "json"
         }
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         return response.json()
 
     def search_album(self, artist_id, album_title):
-        self.api_hits.append(time.time())
-        self.log_api_hits()
+        self.limiter.acquire("musicbrainz", max_wait=self.max_wait)
         url = f"{self.base_url}release-group/"
         params = {
             "artist": artist_id,
             "releasegroup": album_title,
             "fmt": "json"
         }
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         return response.json()
 
     def get_genres(self, artist_name, album_title):
+        title = f"{self.normalize_title(artist_name)}/{self.normalize_title(album_title or '')}"
+        genres = self.cache.get("musicbrainz", title)
+        if genres is self.cache.missing:
+            genres = self.lookup_genres(artist_name, album_title)
+            self.cache.set("musicbrainz", title, genres)
+        return genres
+
+    def lookup_genres(self, artist_name, album_title):
         artist_data = self.search_artist(artist_name)
         if not artist_data['artists']:
             return None
@@ -910,43 +2152,30 @@ class MusicBrainzClient:
             "inc": "genres",
             "fmt": "json"
         }
-        self.api_hits.append(time.time())
-        self.log_api_hits()
-        response = requests.get(url, headers=self.headers, params=params)
+        self.limiter.acquire("musicbrainz", max_wait=self.max_wait)
+        response = self.session.get(url, headers=self.headers, params=params)
         response.raise_for_status()
         album_info = response.json()
         print(album_info)
         return [genre['name'] for genre in album_info.get('genres', [])]
 
 class OMDBClient:
-    def __init__(self, api_key):
+    def __init__(self, api_key, limiter=None, cache=None):
         self.base_url = "http://www.omdbapi.com/"
         self.api_key = api_key
-        self.cache = []
-        self.api_hits = deque()
-
-    def log_api_hits(self):
-        now = time.time()
-        # Remove hits older than 24 hours
-        while self.api_hits and self.api_hits[0] < now - 86400:
-            self.api_hits.popleft()
-        hits_last_24h = len(self.api_hits)
-        
-        # Count hits in the last hour
-        hits_last_hour = sum(1 for hit in self.api_hits if hit >= now - 3600)
-        
-        print(f"OMDB API hits in the last 24 hours: {hits_last_24h} - in the last hour: {hits_last_hour}")
+        self.cache = cache or MetadataCache(":memory:")
+        self.session = http_session()
+        self.limiter = limiter or RateLimiter(metadata_rate_limits)
 
     def search_title(self, title, year=None):
-        self.api_hits.append(time.time())
-        self.log_api_hits()
+        self.limiter.acquire("omdb")
         params = {
             "t": title,
             "apikey": self.api_key
         }
         if year:
             params["y"] = year
-        response = requests.get(self.base_url, params=params)
+        response = self.session.get(self.base_url, params=params)
         response.raise_for_status()
         print(response.json())
         return response.json()
@@ -968,39 +2197,41 @@ class OMDBClient:
         if country:
             search_titles.append(f"{title} {country}")
         for search_title in search_titles:
-            # Check cache first
-            for cached_query in self.cache:
-                if cached_query['title'] == search_title and cached_query['year'] == year:
-                    return cached_query['result']
-            result = self.search_title(search_title, year)
-            normalized_search_title = self.normalize_title(title)
-            normalized_result_title = self.normalize_title(result.get("Title", ""))
-            if normalized_result_title == normalized_search_title:
-                genre = result.get("Genre")
-                if genre and genre.lower() == "n/a":
-                    genre = None
-                # Add to cache
-                self.cache.append({'title': search_title, 'year': year, 'result': genre})
-                # Maintain cache size
-                if len(self.cache) > 50:
-                    self.cache.pop(0)
+            # Check cache first, a cached miss moves on to the next search title
+            genre = self.cache.get("omdb", self.normalize_title(search_title), year)
+            if genre is self.cache.missing:
+                genre = None
+                result = self.search_title(search_title, year)
+                normalized_search_title = self.normalize_title(title)
+                normalized_result_title = self.normalize_title(result.get("Title", ""))
+                if normalized_result_title == normalized_search_title:
+                    genre = result.get("Genre")
+                    if genre and genre.lower() == "n/a":
+                        genre = None
+                self.cache.set("omdb", self.normalize_title(search_title), genre, year)
+            if genre:
                 return genre
-            else:
-                # Cache the search with no result
-                self.cache.append({'title': search_title, 'year': year, 'result': None})
         return None
 
 class SpotifyClient:
-    def __init__(self):
+    def __init__(self, limiter=None, cache=None):
         self.client_id = os.getenv("SPOTIFY_CLIENT_ID")
         self.client_secret = os.getenv("SPOTIFY_CLIENT_SECRET")
         self.access_token = None
         self.token_expires_in = None
         self.token_timestamp = None
-        self.api_hits = deque()
-        self.get_access_token()
+        self.limiter = limiter or RateLimiter(metadata_rate_limits)
+        self.cache = cache or MetadataCache(":memory:")
+        self.session = http_session()
 
     def get_access_token(self):
+        # a token is good for an hour, so a restart doesn't need a new one
+        token = self.cache.get("spotify_token", self.client_id)
+        if token is not self.cache.missing and token and token["expires"] > time.time() + 60:
+            self.access_token = token["access_token"]
+            self.token_expires_in = token["expires"] - time.time()
+            self.token_timestamp = time.time()
+            return
         auth_url = 'https://accounts.spotify.com/api/token'
         auth_headers = {
             'Authorization': 'Basic ' + base64.b64encode(f'{self.client_id}:{self.client_secret}'.encode()).decode()
@@ -1008,33 +2239,26 @@ class SpotifyClient:
         auth_data = {
             'grant_type': 'client_credentials'
         }
-        auth_response = requests.post(auth_url, headers=auth_headers, data=auth_data)
+        auth_response = self.session.post(auth_url, headers=auth_headers, data=auth_data)
         auth_response.raise_for_status()
         auth_response_data = auth_response.json()
         self.access_token = auth_response_data['access_token']
         self.token_expires_in = auth_response_data['expires_in']
         self.token_timestamp = time.time()
+        self.cache.set(
+            "spotify_token",
+            self.client_id,
+            {"access_token": self.access_token, "expires": self.token_timestamp + self.token_expires_in},
+            ttl=int(self.token_expires_in),
+        )
 
     def ensure_token_valid(self):
         if not self.access_token or (time.time() - self.token_timestamp) >= self.token_expires_in:
             self.get_access_token()
 
-    def log_api_hits(self):
-        now = time.time()
-        # Remove hits older than 24 hours
-        while self.api_hits and self.api_hits[0] < now - 86400:
-            self.api_hits.popleft()
-        hits_last_24h = len(self.api_hits)
-        
-        # Count hits in the last hour
-        hits_last_hour = sum(1 for hit in self.api_hits if hit >= now - 3600)
-        
-        print(f"Spotify API hits in the last 24 hours: {hits_last_24h} - in the last hour: {hits_last_hour}")
-
     def search_artist(self, artist_name):
         self.ensure_token_valid()
-        self.api_hits.append(time.time())
-        self.log_api_hits()
+        self.limiter.acquire("spotify")
         search_url = 'https://api.spotify.com/v1/search'
         search_headers = {
             'Authorization': f'Bearer {self.access_token}'
@@ -1043,45 +2267,49 @@ class SpotifyClient:
             'q': artist_name,
             'type': 'artist'
         }
-        search_response = requests.get(search_url, headers=search_headers, params=search_params)
+        search_response = self.session.get(search_url, headers=search_headers, params=search_params)
         search_response.raise_for_status()
         search_response_data = search_response.json()
         return search_response_data['artists']['items'][0] if search_response_data['artists']['items'] else None
 
     def get_genres(self, artist_name):
+        genres = self.cache.get("spotify", artist_name.lower())
+        if genres is not self.cache.missing:
+            return genres
         artist = self.search_artist(artist_name)
-        if artist:
-            return artist['genres']
-        return None
+        genres = artist['genres'] if artist else None
+        self.cache.set("spotify", artist_name.lower(), genres)
+        return genres
 
 class TMDBClient:
-    def __init__(self, api_key):
+    def __init__(self, api_key, limiter=None, cache=None):
         self.api_key = api_key
         self.base_url = "https://api.themoviedb.org/3"
-        self.api_hits = deque()
-        self.cache = {}  # Cache keyed by normalized title (with extra params)
-        # Load genre lookup for TV shows using TMDB's genre API.
-        self.movie_genre_lookup = self.load_genre_lookup(media_type="movie", language="en")
-        self.tv_genre_lookup = self.load_genre_lookup(media_type="tv", language="en")
+        self.limiter = limiter or RateLimiter(metadata_rate_limits)
+        self.cache = cache or MetadataCache(":memory:")  # keyed by normalized title (with extra params)
+        self.session = http_session()
+        # genre ID -> name for movies and TV shows, loaded on first use
+        self.genre_lookups = {}
+
+    def genre_lookup(self, media_type, language="en"):
+        if (media_type, language) not in self.genre_lookups:
+            self.genre_lookups[media_type, language] = self.load_genre_lookup(media_type, language)
+        return self.genre_lookups[media_type, language]
 
     def load_genre_lookup(self, media_type, language="en"):
-        # Loads a mapping from genre ID to genre name.
-        url = f"{self.base_url}/genre/{media_type}/list"
-        params = {"api_key": self.api_key, "language": language}
-        resp = requests.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        lookup = {genre["id"]: genre["name"] for genre in data.get("genres", [])}
+        # Loads a mapping from genre ID to genre name. The list hardly ever changes, so it's
+        # kept in the cache for tmdb_genre_list_ttl seconds.
+        genres = self.cache.get("tmdb_genre_list", media_type, language=language)
+        if genres is self.cache.missing or genres is None:
+            url = f"{self.base_url}/genre/{media_type}/list"
+            params = {"api_key": self.api_key, "language": language}
+            resp = self.session.get(url, params=params)
+            resp.raise_for_status()
+            genres = resp.json().get("genres", [])
+            self.cache.set("tmdb_genre_list", media_type, genres, language=language, ttl=tmdb_genre_list_ttl)
+        lookup = {genre["id"]: genre["name"] for genre in genres}
         return lookup
 
-    def log_api_hits(self):
-        now = time.time()
-        while self.api_hits and self.api_hits[0] < now - 86400:
-            self.api_hits.popleft()
-        hits_last_24h = len(self.api_hits)
-        hits_last_hour = sum(1 for hit in self.api_hits if hit >= now - 3600)
-        print(f"TMDB API hits in the last 24 hours: {hits_last_24h} - in the last hour: {hits_last_hour}")
-
     def normalize_title(self, title):
         # Normalize title by removing non-word characters, removing double spaces,
         # converting to lower case, and replacing "&" with "and"
@@ -1094,9 +2322,9 @@ class TMDBClient:
 
     def get_genres(self, title, year=None, language=None, region=None):
         norm_title = self.normalize_title(title)
-        key = (norm_title, year, language, region)
-        if key in self.cache:
-            return self.cache[key]
+        genres = self.cache.get("tmdb_movie", norm_title, year, language, region)
+        if genres is not self.cache.missing:
+            return genres
 
         search_url = f"{self.base_url}/search/movie"
         params = {"api_key": self.api_key, "query": title, "include_adult": False}
@@ -1107,9 +2335,8 @@ class TMDBClient:
         if region:
             params["region"] = region
 
-        self.api_hits.append(time.time())
-        self.log_api_hits()
-        resp = requests.get(search_url, params=params)
+        self.limiter.acquire("tmdb")
+        resp = self.session.get(search_url, params=params)
         resp.raise_for_status()
         data = resp.json()
         results = data.get("results", [])
@@ -1122,9 +2349,8 @@ class TMDBClient:
                 detail_params = {"api_key": self.api_key}
                 if language:
                     detail_params["language"] = language
-                self.api_hits.append(time.time())
-                self.log_api_hits()
-                detail_resp = requests.get(detail_url, params=detail_params)
+                self.limiter.acquire("tmdb")
+                detail_resp = self.session.get(detail_url, params=detail_params)
                 detail_resp.raise_for_status()
                 detail_data = detail_resp.json()
                 # TMDB detail may include fully expanded "genres"
@@ -1133,18 +2359,18 @@ class TMDBClient:
                 else:
                     # Fall back: if only genre_ids are available, map them using our lookup.
                     genre_ids = detail_data.get("genre_ids", [])
-                    genres_obj = [{"id": gid, "name": self.movie_genre_lookup.get(gid, "Unknown")} for gid in genre_ids]
+                    genres_obj = [{"id": gid, "name": self.genre_lookup("movie").get(gid, "Unknown")} for gid in genre_ids]
                 genre_list = [genre["name"] for genre in genres_obj]
-                self.cache[key] = genre_list
+                self.cache.set("tmdb_movie", norm_title, genre_list, year, language, region)
                 return genre_list
-        self.cache[key] = None
+        self.cache.set("tmdb_movie", norm_title, None, year, language, region)
         return None
 
     def get_tv_genres(self, title, year=None, language=None, region=None):
         norm_title = self.normalize_title(title)
-        key = (norm_title, year, language, region)
-        if key in self.cache:
-            return self.cache[key]
+        genres = self.cache.get("tmdb_tv", norm_title, year, language, region)
+        if genres is not self.cache.missing:
+            return genres
 
         search_url = f"{self.base_url}/search/tv"
         params = {"api_key": self.api_key, "query": title}
@@ -1153,9 +2379,8 @@ class TMDBClient:
         if language:
             params["language"] = language
 
-        self.api_hits.append(time.time())
-        self.log_api_hits()
-        resp = requests.get(search_url, params=params)
+        self.limiter.acquire("tmdb")
+        resp = self.session.get(search_url, params=params)
         resp.raise_for_status()
         data = resp.json()
         results = data.get("results", [])
@@ -1168,9 +2393,8 @@ class TMDBClient:
                 detail_params = {"api_key": self.api_key}
                 if language:
                     detail_params["language"] = language
-                self.api_hits.append(time.time())
-                self.log_api_hits()
-                detail_resp = requests.get(detail_url, params=detail_params)
+                self.limiter.acquire("tmdb")
+                detail_resp = self.session.get(detail_url, params=detail_params)
                 detail_resp.raise_for_status()
                 detail_data = detail_resp.json()
                 # TMDB detail may include fully expanded "genres"
@@ -1179,18 +2403,19 @@ class TMDBClient:
                 else:
                     # Fall back: if only genre_ids are available, map them using our lookup.
                     genre_ids = detail_data.get("genre_ids", [])
-                    genres_obj = [{"id": gid, "name": self.tv_genre_lookup.get(gid, "Unknown")} for gid in genre_ids]
+                    genres_obj = [{"id": gid, "name": self.genre_lookup("tv").get(gid, "Unknown")} for gid in genre_ids]
                 genre_list = [genre["name"] for genre in genres_obj]
-                self.cache[key] = genre_list
+                self.cache.set("tmdb_tv", norm_title, genre_list, year, language, region)
                 return genre_list
-        self.cache[key] = None
+        self.cache.set("tmdb_tv", norm_title, None, year, language, region)
         return None
 
 class TVMazeClient:
-    def __init__(self):
+    def __init__(self, limiter=None, cache=None):
         self.base_url = "http://api.tvmaze.com"
-        self.api_hits = deque()
-        self.cache = {}  # Cache keyed by normalized title
+        self.limiter = limiter or RateLimiter(metadata_rate_limits)
+        self.cache = cache or MetadataCache(":memory:")  # keyed by normalized title
+        self.session = http_session()
 
     def normalize_title(self, title):
         # Normalize title by removing non-word characters, removing double spaces,
@@ -1202,24 +2427,16 @@ class TVMazeClient:
         title = title.replace("ä", "ae").replace("ö", "oe").replace("ü", "ue").replace("ß", "ss")
         return title
 
-    def log_api_hits(self):
-        now = time.time()
-        while self.api_hits and self.api_hits[0] < now - 86400:
-            self.api_hits.popleft()
-        hits_last_24h = len(self.api_hits)
-        hits_last_hour = sum(1 for hit in self.api_hits if hit >= now - 3600)
-        print(f"TVMaze API hits in the last 24 hours: {hits_last_24h} - in the last hour: {hits_last_hour}")
-
     def get_genres(self, title):
         norm_title = self.normalize_title(title)
-        if norm_title in self.cache:
-            return self.cache[norm_title]
+        genres = self.cache.get("tvmaze", norm_title)
+        if genres is not self.cache.missing:
+            return genres
 
         search_url = f"{self.base_url}/search/shows"
         params = {"q": title}
-        self.api_hits.append(time.time())
-        self.log_api_hits()
-        resp = requests.get(search_url, params=params)
+        self.limiter.acquire("tvmaze")
+        resp = self.session.get(search_url, params=params)
         resp.raise_for_status()
         data = resp.json()
         if data:
@@ -1230,27 +2447,103 @@ class TVMazeClient:
                 genres_list = show.get("genres", [])
                 if not isinstance(genres_list, list):
                     genres_list = [genres_list]
-                self.cache[norm_title] = genres_list
+                self.cache.set("tvmaze", norm_title, genres_list)
                 return genres_list
-        self.cache[norm_title] = None
+        self.cache.set("tvmaze", norm_title, None)
         return None
 
 class MetadataAgent:
-    def __init__(self, logger, output_bots, lock):
-        self.musicbrainz_client = MusicBrainzClient()
-        self.spotify_client = SpotifyClient()
-        self.omdb_client = OMDBClient(os.getenv("OMDB_APIKEY", ""))  # TODO: just define the API key in the class, like with SpotifyClient()
-        self.tmdb_client = TMDBClient(os.getenv("TMDB_APIKEY", ""))  # dto.
-        self.tvmaze_client = TVMazeClient()
+    def __init__(
+        self,
+        logger,
+        event_bus,
+        pre_writer,
+        genre_queue_size=500,
+        provider_workers=8,
+        hedge_delay=None,
+        genre_deadline=60,
+        srrdb_workers=4,
+        feed_interval_min=30,
+        feed_interval_max=600,
+    ):
+        # one budget per provider for all clients
+        self.limiter = RateLimiter(metadata_rate_limits)
+        # answers survive restarts, so quotas go to titles we haven't seen yet
+        self.cache = MetadataCache(
+            METADATA_CACHE_DB_FILE,
+            hit_ttl=metadata_cache_hit_ttl,
+            miss_ttl=metadata_cache_miss_ttl,
+            max_entries=metadata_cache_max_entries,
+            memory_size=metadata_memory_cache_size,
+            memory_bytes=metadata_memory_cache_bytes,
+        )
+        self.session = http_session()
+        # clients are created on first use, so starting up doesn't wait for any API
+        self.client_factories = {
+            "musicbrainz": lambda: MusicBrainzClient(self.limiter, self.cache),
+            "spotify": lambda: SpotifyClient(self.limiter, self.cache),
+            "omdb": lambda: OMDBClient(os.getenv("OMDB_APIKEY", ""), self.limiter, self.cache),  # TODO: just define the API key in the class, like with SpotifyClient()
+            "tmdb": lambda: TMDBClient(os.getenv("TMDB_APIKEY", ""), self.limiter, self.cache),  # dto.
+            "tvmaze": lambda: TVMazeClient(self.limiter, self.cache),
+        }
+        self.clients = {}
+        self.clients_lock = threading.Lock()
         self.srrdb_feed_url = "https://www.srrdb.com/feed/srrs"
         self.srrdb_api_url = "https://api.srrdb.com/v1/details/"
         self.logger = logger
-        self.output_bots = output_bots
-        self.lock = lock
-
-        with sqlite3.connect(os.getenv("PRE_DB_FILE"), check_same_thread=False) as conn:
-            self.conn = conn
-            self.conn.row_factory = sqlite3.Row
+        self.event_bus = event_bus
+        self.pre_writer = pre_writer
+        # only reads, all writes go through the PreDBWriter
+        self.conn = PreDBWriter.connect(os.getenv("PRE_DB_FILE", PRE_DB_FILE), read_only=True)
+        # genre lookups for new pres, run by run_genre_worker threads
+        self.genre_queue = queue.Queue(maxsize=genre_queue_size)
+        self.genre_lock = threading.Lock()
+        self.genre_done = 0
+        self.genre_dropped = 0
+        self.genre_failed = 0
+        self.genre_timeouts = 0
+        # providers of one lookup are asked by these threads, see first_genres()
+        self.providers = concurrent.futures.ThreadPoolExecutor(provider_workers, thread_name_prefix="metadata")
+        self.hedge_delay = hedge_delay
+        self.genre_deadline = genre_deadline
+        # srrDB feed state, see poll_feed() and next_poll_interval()
+        self.feed_etag = None
+        self.feed_modified = None
+        self.feed_last = None
+        self.feed_polled = None
+        self.feed_cadence = None
+        self.feed_interval_min = feed_interval_min
+        self.feed_interval_max = feed_interval_max
+        self.feed_interval = feed_interval_min
+        # srrDB details of a feed poll are fetched in parallel
+        self.srrdb_fetches = concurrent.futures.ThreadPoolExecutor(srrdb_workers, thread_name_prefix="srrdb")
+
+    def client(self, name):
+        with self.clients_lock:
+            if name not in self.clients:
+                self.clients[name] = self.client_factories[name]()
+                self.logger.debug(f"{VERBOSE} Created {name} client")
+            return self.clients[name]
+
+    @property
+    def musicbrainz_client(self):
+        return self.client("musicbrainz")
+
+    @property
+    def spotify_client(self):
+        return self.client("spotify")
+
+    @property
+    def omdb_client(self):
+        return self.client("omdb")
+
+    @property
+    def tmdb_client(self):
+        return self.client("tmdb")
+
+    @property
+    def tvmaze_client(self):
+        return self.client("tvmaze")
 
     def normalize_genre(self, genre):
         # Lowercase
@@ -1280,6 +2573,65 @@ class MetadataAgent:
         genres = [g for g in genres if g]  # Remove empty strings
         return genres if genres else None
                  
+    def ask(self, get_genres, *args, **kwargs):
+        # A provider that is out of budget is skipped, so the next one gets a chance
+        try:
+            return get_genres(*args, **kwargs)
+        except RateLimitExceeded as e:
+            self.logger.debug(f"{VERBOSE} Rate limit for {e} reached, skipping it.")
+            return None
+
+    def first_genres(self, calls):
+        """Ask the providers in calls, (get_genres, args, kwargs) in order of priority, and return the
+        genres of the first one that has any. The next provider is asked as soon as the previous one
+        came back empty, or after hedge_delay seconds without an answer. Answers of lower priority
+        are only used once everything before them came back empty. Gives up after deadline seconds,
+        providers still running then finish in the background (and fill the cache)."""
+        now = time.monotonic()
+        deadline = now + self.genre_deadline
+        next_start = now
+        pending = list(calls)
+        started = []  # (get_genres, future) in order of priority
+        running = set()  # futures whose answer hasn't been looked at yet
+        answers = {}  # future -> cleaned genres, each future is only looked at once
+        while True:
+            # no new provider once the deadline has passed, its answer wouldn't be used anyway
+            if pending and now < deadline and (now >= next_start or not running):
+                get_genres, args, kwargs = pending.pop(0)
+                future = self.providers.submit(self.ask, get_genres, *args, **kwargs)
+                started.append((get_genres, future))
+                running.add(future)
+                next_start = now + self.hedge_delay if self.hedge_delay is not None else deadline
+            for get_genres, future in started:
+                if future in running and future.done():
+                    running.discard(future)
+                    try:
+                        answers[future] = self.clean_genres(future.result())
+                    except requests.exceptions.RequestException as e:
+                        self.logger.error(f"{ERROR} {get_genres.__qualname__}: {e}")
+                        answers[future] = None
+                    except Exception as e:
+                        self.logger.error(f"{ERROR} {get_genres.__qualname__}: {e}", exc_info=True)
+                        answers[future] = None
+            for get_genres, future in started:
+                if future not in answers:
+                    break
+                if answers[future]:
+                    return answers[future]
+            else:
+                if not pending:
+                    return None
+                if now < deadline:
+                    continue
+            if now >= deadline:
+                self.logger.debug(f"{VERBOSE} No genres within {self.genre_deadline} seconds, giving up.")
+                with self.genre_lock:
+                    self.genre_timeouts += 1
+                return None
+            until = min(next_start, deadline) if pending else deadline
+            concurrent.futures.wait(running, timeout=until - now, return_when=concurrent.futures.FIRST_COMPLETED)
+            now = time.monotonic()
+
     def determine_genre(self, parsed_release):
         try:
             if parsed_release["type"] == "Music":
@@ -1287,16 +2639,14 @@ class MetadataAgent:
                 title = parsed_release.get("title")
                 title_extra = parsed_release.get("title_extra")
                 if artist:
-                    genres = self.musicbrainz_client.get_genres(artist, title)
+                    calls = [(self.musicbrainz_client.get_genres, (artist, title), {})]
                 # [PRE] [FLAC] VA-Hip_Hop_Classics_Volume_Three-CD-FLAC-1997-THEVOiD 
                 # {'release': 'VA-Hip_Hop_Classics_Volume_Three-CD-FLAC-1997-THEVOiD', 'title': 'Various', 'title_extra': 'Hip Hop Classics Volume Three', 'group': 'THEVOiD', 'year': 1997, 'date': None, 'season': None, 'episode': None, 'disc': None, 'flags': None, 'source': 'CD', 'format': 'FLAC', 'resolution': None, 'audio': None, 'device': None, 'os': None, 'version': None, 'language': None, 'country': None, 'type': 'Music'}
                 else:
-                    genres = self.musicbrainz_client.get_genres(title, title_extra)
-                if not genres and artist != "Various" and title != "Various":
-                    genres = self.spotify_client.get_genres(artist or title)
-                genres = self.clean_genres(genres)
-                if genres:
-                    return genres
+                    calls = [(self.musicbrainz_client.get_genres, (title, title_extra), {})]
+                if artist != "Various" and title != "Various":
+                    calls.append((self.spotify_client.get_genres, (artist or title,), {}))
+                return self.first_genres(calls)
                     
             elif parsed_release["type"] in ["TV", "Movie"]:
                 title = parsed_release.get("title")
@@ -1326,21 +2676,17 @@ class MetadataAgent:
                 else:
                     language = lang_data
 
+                calls = [(self.omdb_client.get_genres, (title, title_extra, country, year), {})]
                 if parsed_release["type"] == "TV":
                     # For TV shows, try OMDB first, then TMDB, then TVMaze.
-                    genres = self.omdb_client.get_genres(title, title_extra, country, year)
-                    if not genres and os.getenv("TMDB_APIKEY", ""):
-                        genres = self.tmdb_client.get_tv_genres(title, year, language=language, region=country)
-                    if not genres:
-                        genres = self.tvmaze_client.get_genres(title)
-                elif parsed_release["type"] == "Movie":
+                    if os.getenv("TMDB_APIKEY", ""):
+                        calls.append((self.tmdb_client.get_tv_genres, (title, year), {"language": language, "region": country}))
+                    calls.append((self.tvmaze_client.get_genres, (title,), {}))
+                else:
                     # For movies, try OMDB first then TMDB.
-                    genres = self.omdb_client.get_genres(title, title_extra, country, year)
-                    if not genres and os.getenv("TMDB_APIKEY", ""):
-                        genres = self.tmdb_client.get_genres(title, year, language=language, region=country)
-                genres = self.clean_genres(genres)
-                if genres:
-                    return genres
+                    if os.getenv("TMDB_APIKEY", ""):
+                        calls.append((self.tmdb_client.get_genres, (title, year), {"language": language, "region": country}))
+                return self.first_genres(calls)
         except requests.exceptions.HTTPError as e:
             self.logger.error(f"HTTP error occurred: {e}", exc_info=True)
         except requests.exceptions.ConnectionError as e:
@@ -1349,102 +2695,185 @@ class MetadataAgent:
             self.logger.error(f"{ERROR}: {Exception} - {e}", exc_info=True)
         return None
 
+    def submit_genre(self, parsed_release, callback):
+        """Queue a genre lookup, callback(genres) is called from a worker thread. Returns False
+        and drops the lookup if the queue is full."""
+        try:
+            self.genre_queue.put_nowait((parsed_release, callback))
+            return True
+        except queue.Full:
+            with self.genre_lock:
+                self.genre_dropped += 1
+            self.logger.debug(f"{VERBOSE} Genre queue is full, skipping {parsed_release.get('release')}")
+            return False
+
+    def run_genre_worker(self):
+        stop_event = getattr(self, "stop_event", threading.Event())
+        while not stop_event.is_set():
+            try:
+                parsed_release, callback = self.genre_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                callback(self.determine_genre(parsed_release))
+                with self.genre_lock:
+                    self.genre_done += 1
+            except Exception as e:
+                with self.genre_lock:
+                    self.genre_failed += 1
+                self.logger.error(f"Error looking up genres: {e}", exc_info=True)
+
+    def stats(self):
+        with self.genre_lock:
+            return {
+                "queued": self.genre_queue.qsize(),
+                "done": self.genre_done,
+                "dropped": self.genre_dropped,
+                "failed": self.genre_failed,
+                "timeouts": self.genre_timeouts,
+            }
+
     def determine_info(self):
         getattr(self, "stop_event", threading.Event()).wait(timeout=60) # Wait for the OutputBots to start
         while not getattr(self, "stop_event", threading.Event()).is_set():
             try:
-                feed = feedparser.parse(self.srrdb_feed_url)
-                if feed.bozo:
-                    print(f"Feed bozo exception: {feed.bozo_exception}")
-                    if hasattr(feed.bozo_exception, 'getcode'):
-                        raise requests.exceptions.HTTPError(f"HTTP error {feed.bozo_exception.getcode()} occurred while fetching feed: {self.srrdb_feed_url}")
-
-                # Process items in reversed order (oldest first)
-                items = feed.entries[::-1]
-                for entry in items:
-                    release_name = entry.title
-                    # Check the release name against the pre table
-                    cursor = self.conn.cursor()
-                    cursor.execute("SELECT release, files, size FROM pre WHERE release=?", (release_name,))
-                    row = cursor.fetchone()
-                    cursor.close()
-                    if row and (row["files"] is None or row["size"] is None):
-                        # Fetch details from SRRDB API
-                        response = requests.get(f"{self.srrdb_api_url}{release_name}")
-                        response.raise_for_status()
-                        data = response.json()
-                        files = data.get("files", [])
-                        total_files = len([f for f in files if not f["name"].lower().endswith((".nfo", ".sfv", ".m3u")) and not any(folder in f["name"].lower() for folder in ["subs/", "proof/", "sample/"])])
-                        total_size = sum(f["size"] for f in files if not f["name"].lower().endswith((".nfo", ".sfv", ".m3u")) and not any(folder in f["name"].lower() for folder in ["subs/", "proof/", "sample/"]))
-                        total_size_mib = round(total_size / (1024 * 1024))
-
-                        if total_files == 0 or total_size_mib == 0:
-                            continue
-
-                        info_message = {
-                            "type": "INFO",
-                            "release": release_name,
-                            "files": total_files,
-                            "size": total_size_mib
-                        }
-                        self.process_info_message(info_message)
-
-                # Get the pubDate of the feed
-                feed_pub_date = feed.feed.published_parsed
-                next_pull_time = datetime.datetime(*feed_pub_date[:6]) + datetime.timedelta(seconds=65)
-
-                # Calculate the sleep time until the next pull
-                sleep_time = (next_pull_time - datetime.datetime.now()).total_seconds()
-                if sleep_time > 0:
-                    getattr(self, "stop_event", threading.Event()).wait(timeout=sleep_time)
-                else:
-                    getattr(self, "stop_event", threading.Event()).wait(timeout=60)
+                started = time.monotonic()
+                releases = self.poll_feed()
+                self.process_info_messages(self.fetch_infos(releases))
+
+                self.logger.debug(f"{VERBOSE} Genre lookups: {self.stats()} - API requests: {self.limiter.stats()} - Cache: {self.cache.stats()}")
+
+                interval = self.next_poll_interval(len(releases), started)
+                self.logger.debug(f"{VERBOSE} {len(releases)} new srrDB releases, next poll in {interval:.0f} seconds")
+                getattr(self, "stop_event", threading.Event()).wait(timeout=interval)
             except requests.exceptions.HTTPError as e:
                 self.logger.error(f"HTTP error occurred: {e}", exc_info=True)
+                getattr(self, "stop_event", threading.Event()).wait(timeout=60)
             except Exception as e:
                 self.logger.error(f"Error in determine_info: {e}", exc_info=True)
                 getattr(self, "stop_event", threading.Event()).wait(timeout=60)  # Check every minute
 
-    def process_info_message(self, message):
-        result = {}
-        result["type"] = message.get("type")
-        result["release"] = message.get("release")
-        result["files"] = message.get("files")
-        result["size"] = message.get("size")
-        result["genre"] = message.get("genre")
-
+    def poll_feed(self):
+        """Names of the releases added to the srrDB feed since the last poll, oldest first. The feed
+        is only downloaded and parsed if it changed (ETag / Last-Modified)."""
+        headers = {}
+        if self.feed_etag:
+            headers["If-None-Match"] = self.feed_etag
+        if self.feed_modified:
+            headers["If-Modified-Since"] = self.feed_modified
+        response = self.session.get(self.srrdb_feed_url, headers=headers)
+        if response.status_code == 304:
+            return []
+        response.raise_for_status()
+        feed = feedparser.parse(response.content)
+        if feed.bozo:
+            print(f"Feed bozo exception: {feed.bozo_exception}")
+            if hasattr(feed.bozo_exception, 'getcode'):
+                raise requests.exceptions.HTTPError(f"HTTP error {feed.bozo_exception.getcode()} occurred while fetching feed: {self.srrdb_feed_url}")
+        self.feed_etag = response.headers.get("ETag")
+        self.feed_modified = response.headers.get("Last-Modified")
+
+        # newest first, up to the last entry we've already seen
+        releases = []
+        for entry in feed.entries:
+            if entry.get("id", entry.title) == self.feed_last:
+                break
+            releases.append(entry.title)
+        if feed.entries:
+            self.feed_last = feed.entries[0].get("id", feed.entries[0].title)
+        # Process items in reversed order (oldest first)
+        return releases[::-1]
+
+    def next_poll_interval(self, new_entries, now=None):
+        """Seconds until the next feed poll. Follows the average time between new entries, and backs
+        off while nothing new shows up, within feed_interval_min and feed_interval_max."""
+        now = time.monotonic() if now is None else now
+        if self.feed_polled is not None:
+            elapsed = now - self.feed_polled
+            if new_entries:
+                # one new entry every elapsed / new_entries seconds, averaged over the last polls
+                gap = elapsed / new_entries
+                self.feed_cadence = gap if self.feed_cadence is None else 0.7 * self.feed_cadence + 0.3 * gap
+                self.feed_interval = self.feed_cadence
+            else:
+                self.feed_interval *= 1.5
+        self.feed_polled = now
+        self.feed_interval = min(max(self.feed_interval, self.feed_interval_min), self.feed_interval_max)
+        return self.feed_interval
+
+    def missing_infos(self, releases):
+        """The releases in pre.db that don't have files or size yet, in the given order, each once."""
+        releases = list(dict.fromkeys(releases))
+        missing = set()
+        # in chunks, to stay below SQLite's limit of host parameters
+        for i in range(0, len(releases), 500):
+            chunk = releases[i:i + 500]
+            cursor = self.conn.execute(
+                f"SELECT release FROM pre WHERE release IN ({','.join('?' * len(chunk))}) AND (files IS NULL OR size IS NULL)",
+                chunk,
+            )
+            missing.update(row["release"] for row in cursor.fetchall())
+        return [release for release in releases if release in missing]
+
+    @staticmethod
+    def count_files(files):
+        # number and size of the files that make up the release, without nfo, sfv, m3u, subs, proof and sample
+        total_files = 0
+        total_size = 0
+        for f in files:
+            name = f["name"].lower()
+            if name.endswith((".nfo", ".sfv", ".m3u")) or any(folder in name for folder in ["subs/", "proof/", "sample/"]):
+                continue
+            total_files += 1
+            total_size += f["size"]
+        return total_files, round(total_size / (1024 * 1024))
+
+    def fetch_info(self, release_name):
         try:
-            self.lock.acquire()
-            cursor = self.conn.cursor()
+            response = self.session.get(f"{self.srrdb_api_url}{release_name}")
+            response.raise_for_status()
+            total_files, total_size_mib = self.count_files(response.json().get("files", []))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.logger.error(f"{ERROR} srrDB details for {release_name}: {e}")
+            return None
+        if total_files == 0 or total_size_mib == 0:
+            return None
+        return {
+            "type": "INFO",
+            "release": release_name,
+            "files": total_files,
+            "size": total_size_mib
+        }
 
-            if result["type"].lower() == "info":
-                cursor.execute(
-                    "UPDATE pre SET size=?, files=? WHERE release=?",
-                    (
-                        result["size"],
-                        result["files"],
-                        result["release"],
-                    ),
-                )
-                self.broadcast("info", result)  # Notify the Broadcaster
-            self.conn.commit()
+    def fetch_infos(self, releases):
+        """INFO messages from the srrDB details of the releases that need them, fetched by srrdb_fetches
+        at a time."""
+        infos = self.srrdb_fetches.map(self.fetch_info, self.missing_infos(releases))
+        return [info for info in infos if info]
+
+    def process_info_messages(self, messages):
+        # all of them in one transaction, then announce the ones that changed pre.db
+        if not messages:
+            return
+        try:
+            updated = self.pre_writer.submit(self.pre_writer.update_infos, messages).result()
         except sqlite3.Error as error:
-            self.logger.error(f"srrAPI - {error} - {message}", exc_info=True)
-        finally:
-            cursor.close()
-            self.lock.release()
+            self.logger.error(f"srrAPI - {error} - {len(messages)} messages", exc_info=True)
+            return
+        for message in messages:
+            if message["release"] in updated:
+                self.broadcast("info", dict(message, genre=None))  # Notify the Broadcaster
 
     def broadcast(self, message_type, data, parsed_release=None):
-        for bot in self.output_bots:
-            bot.broadcast(message_type, data, parsed_release)
+        self.event_bus.publish(message_type, data, parsed_release)
 
 
 #
 # scene2arr.py, scenerename.py
 #
 class DB(object):
-    def __init__(self, dbname):
-        self.connection = sqlite3.connect(dbname)
+    def __init__(self, dbname, check_same_thread=True):
+        self.connection = sqlite3.connect(dbname, check_same_thread=check_same_thread)
         self.cursor = self.connection.cursor()
 
 
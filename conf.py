@@ -0,0 +1,154 @@
+#
+# scene2arr.py
+#
+
+# see https://api.xrel.to/v2/release/categories.xml for a list of available categories
+xrel_categories = (
+    "ENGLISH",       # contains English language TV and MOViE releases
+)
+
+# You'll finda list of available types, languages and formats in scene-release-parser-php/ReleasePatterns.php
+# acceptable release types for sonarr/radarr
+irc_types = (
+    "Anime",
+    "TV",
+    "Sports",
+    "Movie"
+)
+
+# acceptable languages for sonarr/radarr
+irc_languages = [
+    {"de"},
+    {"de", "multi"},
+    {"en"},
+    set() # = No language in release name
+    # Add more valid combinations as needed
+]
+
+# acceptable formats for sonarr/radarr
+irc_formats = (
+    "AVC",
+    "x264",
+    "x265",
+    "h264",
+    "h265",
+    "HEVC"
+)
+# Classify IRC messages with one combined regex per channel instead of trying pre_regex,
+# nuke_regex, info_regex and addold_regex one after another. Results are identical.
+irc_single_pass_classifier = True
+
+# Number of long-running PHP processes parsing release names (parserelease_worker.php),
+# and how many seconds to wait for one of them before it gets restarted
+release_parser_workers = 2
+release_parser_timeout = 10
+
+# Parsed releases are cached, so releases announced by several networks (or handled by
+# both -i and -p) are only parsed once. Number of releases to keep, and for how many seconds
+release_parser_cache_size = 5000
+release_parser_cache_ttl = 3600
+
+# -i keeps the *arr release profiles in memory and reloads them after this many seconds
+# (or right away, if an instance rejects a change)
+pvr_profile_max_age = 3600
+
+# Groups found by -i are collected for this many seconds and written with one PUT per release profile
+pvr_update_window = 30
+
+# Failed release profile updates are retried with exponential backoff (in seconds) up to
+# pvr_write_max_attempts times. After pvr_breaker_threshold failures in a row, an instance is
+# left alone for pvr_breaker_cooldown seconds. Changes that are still waiting when scene2arr
+# stops are retried by the next run, changes that ran out of attempts are dropped.
+pvr_write_max_attempts = 8
+pvr_write_backoff = 5
+pvr_write_max_backoff = 600
+pvr_breaker_threshold = 3
+pvr_breaker_cooldown = 300
+# how long -x, -a and -r wait for their changes to be written before exiting
+pvr_write_timeout = 120
+
+# All HTTP clients (*arr instances, xREL, srrDB and the metadata APIs) share keep-alive connections,
+# up to http_pool_size per host. Requests time out after (connect, read) seconds, and failed
+# connections or 5xx answers are retried up to http_retries times, backing off from http_backoff seconds.
+http_timeout = (5, 30)
+http_retries = 3
+http_backoff = 0.5
+http_pool_size = 10
+
+# pre.db is written by a single thread, which commits every pre_db_batch_size messages
+# or every pre_db_batch_window seconds, whichever comes first.
+pre_db_batch_size = 100
+pre_db_batch_window = 0.05
+
+# SQLite settings for pre.db. The journal mode is stored in the database, the pragmas are
+# applied to every connection. With WAL, reading pre.db doesn't wait for the writer.
+pre_db_journal_mode = "WAL"
+pre_db_pragmas = {
+    "synchronous": "NORMAL",  # with WAL, only the last commits can be lost in a power failure
+    "cache_size": -16000,  # in KiB
+    "mmap_size": 268435456,  # in bytes
+    "busy_timeout": 5000,  # in milliseconds
+}
+
+# The last pre_db_recent_size releases are kept in memory, so copies of a pre from other
+# networks are dropped without a database lookup. Loaded from the last pre_db_recent_hours on start.
+pre_db_recent_size = 100000
+pre_db_recent_hours = 24
+
+# Every copy of a pre that arrives within pre_latency_max_delay seconds of the first one is
+# recorded, and summed up per source every pre_latency_rollup_interval seconds over the last
+# pre_latency_days days. Show the ranking with: python3 scene2arr.py -l
+pre_latency_max_delay = 600
+pre_latency_rollup_interval = 3600
+pre_latency_days = 7
+
+# srrDB details of new releases in its feed are fetched this many at a time
+srrdb_fetch_workers = 4
+# The srrDB feed is polled about as often as new releases show up in it, and less often while
+# nothing new does, but never more often than every srrdb_feed_interval_min seconds and at least
+# every srrdb_feed_interval_max seconds
+srrdb_feed_interval_min = 30
+srrdb_feed_interval_max = 600
+
+# OutputBots send at most output_send_rate lines per second, in bursts of up to output_send_burst
+# (send_rate and send_burst of an output server in irc.yaml take precedence). Up to
+# output_queue_size messages wait to be sent; INFO messages are skipped once output_info_backlog wait.
+output_send_rate = 1.0
+output_send_burst = 5
+output_queue_size = 1000
+output_info_backlog = 100
+
+# Genres of new pres are looked up by this many threads. If more than metadata_genre_queue_size
+# lookups are waiting, new ones are skipped.
+metadata_genre_workers = 4
+metadata_genre_queue_size = 500
+# The providers of a lookup are asked in order of priority (OMDB, TMDB, TVMaze; MusicBrainz, Spotify).
+# With metadata_hedge_delay set, the next provider is also asked if the previous one hasn't answered
+# within that many seconds (0 asks all of them at once); None waits for each answer in turn. The best
+# answer wins. A lookup gives up after metadata_genre_deadline seconds. metadata_provider_workers
+# threads are shared by all lookups.
+metadata_hedge_delay = 1.5
+metadata_genre_deadline = 20
+metadata_provider_workers = 8
+
+# Request budgets of the metadata APIs as (requests, seconds) windows. A provider that is out of
+# budget is skipped and the next one is asked instead.
+metadata_rate_limits = {
+    "musicbrainz": [(1, 1)],  # 1 request per second
+    "omdb": [(1000, 86400)],  # free API keys get 1,000 requests per day
+    "tmdb": [(40, 10)],
+    "spotify": [(30, 30)],  # Spotify uses a rolling 30 second window
+    "tvmaze": [(20, 10)],  # 20 calls every 10 seconds
+}
+
+# Metadata API answers are cached in metadata.db, genres for metadata_cache_hit_ttl seconds and
+# titles without genres for metadata_cache_miss_ttl seconds, up to metadata_cache_max_entries.
+metadata_cache_hit_ttl = 2592000  # 30 days
+metadata_cache_miss_ttl = 86400  # 1 day
+metadata_cache_max_entries = 100000
+# The most recently used answers are also kept in memory, at most metadata_memory_cache_size
+# of them and metadata_memory_cache_bytes (as JSON) in total.
+metadata_memory_cache_size = 2000
+metadata_memory_cache_bytes = 4194304  # 4 MiB
+# TMDB's lists of genre names are cached for this many seconds
+tmdb_genre_list_ttl = 604800  # 7 days
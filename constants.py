@@ -6,6 +6,7 @@ from colorama import Fore
 SCENE2ARR_DB_FILE = "scene2arr.db"
 PRE_DB_FILE = "pre.db"
 IRC_CONFIG_FILE = "irc.yaml"
+METADATA_CACHE_DB_FILE = "metadata.db"
 
 #
 # scenerename.py
@@ -0,0 +1,44 @@
+<?php
+require_once __DIR__ . '/scene-release-parser-php/ReleaseParser.php';
+
+use ReleaseParser\ReleaseParser;
+
+// Warnings and notices go to STDERR, STDOUT only carries the answers
+ini_set('display_errors', 'stderr');
+
+// Long-running variant of parserelease.php, used by the worker pool in classes.py.
+// Reads one JSON request per line from STDIN and answers each with one JSON line on STDOUT:
+//   {"release": "...", "section": "..."}  ->  parsed release data
+//   {"ping": true}                        ->  {"pong": true}
+// The request_id of a request is copied to its answer.
+while (($line = fgets(STDIN)) !== false) {
+    $request = json_decode($line, true);
+
+    if (!is_array($request)) {
+        $data = ["error" => "Invalid request."];
+    } elseif (isset($request["ping"])) {
+        $data = ["pong" => true];
+    } elseif (isset($request["release"], $request["section"])) {
+        try {
+            $parser = new ReleaseParser($request["release"], $request["section"]);
+            $data = $parser->data;
+        } catch (Throwable $e) {
+            $data = ["error" => $e->getMessage()];
+        }
+    } else {
+        $data = ["error" => "Insufficient arguments provided."];
+    }
+
+    if (is_array($request) && isset($request["request_id"])) {
+        $data["request_id"] = $request["request_id"];
+    }
+
+    // Output the data as JSON, always exactly one line per request
+    $json = json_encode($data);
+    if ($json === false) {
+        $json = json_encode(["error" => json_last_error_msg(), "request_id" => $data["request_id"] ?? null]);
+    }
+    echo $json . "\n";
+    fflush(STDOUT);
+}
+?>
@@ -294,6 +294,44 @@ def convert_pre_db_v3(dbname):
     set_db_version(dbname, 3)  # Set the new version after conversion
     logging.info(f"Conversion of {dbname} to version 3 completed")
 
+def convert_pre_db_v4(dbname):
+    logging.info(f"Converting {dbname} to version 4")
+    conn = sqlite3.connect(dbname)
+    cursor = conn.cursor()
+
+    logging.info("Creating index on the nuke table")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS nuke_release_type_reason ON nuke (release, type, reason, nukenet)"
+    )
+
+    logging.info("Creating nuke_state table")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nuke_state (
+            release TEXT PRIMARY KEY,
+            type TEXT,
+            reason TEXT,
+            nukenet TEXT,
+            source TEXT,
+            timestamp INTEGER
+        )
+    """)
+
+    logging.info("Filling nuke_state with the latest nuke of every release")
+    cursor.execute("""
+        INSERT OR REPLACE INTO nuke_state (release, type, reason, nukenet, source, timestamp)
+        SELECT release, type, reason, nukenet, source, timestamp
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY release ORDER BY timestamp DESC, id DESC) AS position
+            FROM nuke
+        )
+        WHERE position = 1
+    """)
+
+    conn.commit()
+    conn.close()
+    set_db_version(dbname, 4)  # Set the new version after conversion
+    logging.info(f"Conversion of {dbname} to version 4 completed")
+
 def update_irc_yaml(yaml_file):
     logging.info(f"Updating IRC YAML file: {yaml_file}")
 
@@ -327,5 +365,9 @@ if os.path.exists('./test/irc2arr.db'):
 if os.path.exists('./pre.db') and get_db_version('./pre.db') < 3:
     convert_pre_db_v3('./pre.db')
 
+# Convert pre.db to version 4 if it exists and hasn't been converted yet
+if os.path.exists('./pre.db') and get_db_version('./pre.db') < 4:
+    convert_pre_db_v4('./pre.db')
+
 if os.path.exists('./pre.db'):
     update_irc_yaml('./irc.yaml')
\ No newline at end of file
@@ -18,7 +18,7 @@ def start_argparse():
     # argument parser
     parser = argparse.ArgumentParser(
         description="This script adds release groups to the *arr apps, or removes them.",
-        usage=f"python3 {sys.argv[0]} [-h] ([-i] [-p]) | ([-x] | [[-a | -r] GROUP])",
+        usage=f"python3 {sys.argv[0]} [-h] ([-i] [-p]) | ([-x] | [[-a | -r] GROUP] | [-l])",
     )
     parser.add_argument(
         "-v",
@@ -69,6 +69,14 @@ def start_argparse():
         default=False,
         help="Remove group.",
     )
+    action.add_argument(
+        "-l",
+        "--latency",
+        action="store_const",
+        const=True,
+        default=False,
+        help="Rank the input servers in irc.yaml by how early they announce pres (needs -p to have run for a while).",
+    )
     parser.add_argument(
         "group", metavar="GROUP", type=str, nargs="?", help="Name of release group."
     )
@@ -82,19 +90,23 @@ def start_argparse():
         if args["add"] or args["remove"] or args["irc"] or args["predb"] or args["group"]:
             parser.error("-x cannot be used with -a, -r, -i, -p, or GROUP")
     if args["irc"] or args["predb"]:
-        if args["add"] or args["remove"] or args["xrel"] or args["group"]:
-            parser.error("-i and -p cannot be used with -a, -r, -x, or GROUP")
+        if args["add"] or args["remove"] or args["xrel"] or args["latency"] or args["group"]:
+            parser.error("-i and -p cannot be used with -a, -r, -x, -l, or GROUP")
+    if args["latency"] and args["group"]:
+        parser.error("-l cannot be used with GROUP")
 
     return args
 
 
-def create_scene2arr_db(dbname, user_version=2):
+def create_scene2arr_db(dbname, user_version=2, check_same_thread=True):
+    from classes import DB
+
     # set up the database
     if not os.path.exists(dbname):
         with open(dbname, "w"):
             pass
 
-    db = DB(dbname)
+    db = DB(dbname, check_same_thread=check_same_thread)
 
     # Check the current user_version
     db.cursor.execute("PRAGMA user_version")
@@ -124,12 +136,23 @@ def create_scene2arr_db(dbname, user_version=2):
         );"""
     )
 
+    # release profile changes that haven't been written to the *arr instance yet
+    db.cursor.execute(
+        """CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY,
+        pvr TEXT,
+        changes TEXT,
+        attempts INTEGER,
+        timestamp INTEGER
+        );"""
+    )
+
     db.cursor.execute(f"PRAGMA user_version = {user_version}")
     db.connection.commit()
 
     return db
 
-def create_pre_db(dbname, user_version=3):
+def create_pre_db(dbname, user_version=4):
     # set up the database
     if not os.path.exists(dbname):
         with open(dbname, "w"):
@@ -145,6 +168,9 @@ def create_pre_db(dbname, user_version=3):
         # Run the update script if the version is below the required version
         subprocess.run(["python3", "run_post_update.py"])
 
+    # The journal mode is stored in the database file, so it only has to be set once
+    db.cursor.execute(f"PRAGMA journal_mode = {pre_db_journal_mode}")
+
     db.cursor.execute(
         """CREATE TABLE IF NOT EXISTS pre (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -171,6 +197,51 @@ def create_pre_db(dbname, user_version=3):
         )"""
     )
 
+    # covers every lookup PreDBWriter.record_nuke does on the nuke history
+    db.cursor.execute(
+        "CREATE INDEX IF NOT EXISTS nuke_release_type_reason ON nuke (release, type, reason, nukenet)"
+    )
+
+    # for loading the releases of the last hours into PreDBWriter.recent_pres
+    db.cursor.execute("CREATE INDEX IF NOT EXISTS pre_timestamp ON pre (timestamp)")
+
+    # how many seconds after the first announcement each source announced a pre
+    db.cursor.execute(
+        """CREATE TABLE IF NOT EXISTS pre_latency (
+            release TEXT,
+            source TEXT,
+            delay REAL,
+            timestamp INTEGER,
+            PRIMARY KEY (release, source)
+        )"""
+    )
+    db.cursor.execute("CREATE INDEX IF NOT EXISTS pre_latency_timestamp ON pre_latency (timestamp)")
+
+    # per source percentiles of pre_latency, updated by PreDBWriter.run_rollups
+    db.cursor.execute(
+        """CREATE TABLE IF NOT EXISTS pre_latency_rollup (
+            source TEXT PRIMARY KEY,
+            samples INTEGER,
+            first INTEGER,
+            p50 REAL,
+            p90 REAL,
+            p99 REAL,
+            timestamp INTEGER
+        )"""
+    )
+
+    # latest nuke, unnuke, modnuke etc. per release, kept up to date by PreDBWriter.record_nuke
+    db.cursor.execute(
+        """CREATE TABLE IF NOT EXISTS nuke_state (
+            release TEXT PRIMARY KEY,
+            type TEXT,
+            reason TEXT,
+            nukenet TEXT,
+            source TEXT,
+            timestamp INTEGER
+        )"""
+    )
+
     db.cursor.execute(f"PRAGMA user_version = {user_version}")
     db.connection.commit()
 
@@ -200,31 +271,39 @@ def init_pvrs(logger):
     pvrs = [pvr for pvr in (sonarr, sonarr4k, radarr, radarr4k) if pvr.apikey and pvr.url]
 
     for pvr in pvrs:
-        notify_headers = {
-            "content-type": "application/json",
-            "accept": "application/json",
-            "X-Api-Key": pvr.apikey,
-        }
-        pvr.response = requests.get(pvr.url, headers=notify_headers)
-
-        if pvr.response.status_code != 200:
-            logger.error(f"{ERROR} Something's wrong with {pvr.name}")
-            continue
+        load_pvr(logger, pvr)
 
-        pvr.response = pvr.response.json()
-        pvr.required = pvr.response["required"]
-        pvr.ignored = pvr.response["ignored"]
+    return pvrs
 
-        if isinstance(pvr.required, str):
-            pvr.required = pvr.required.split(",")
-        elif not isinstance(pvr.required, list):
-            logger.error(f"{ERROR} Restrictions in {pvr.name} are neither LIST nor STR.")
-            pvr.skip = True
 
-    return pvrs
+def load_pvr(logger, pvr):
+    from classes import http_session
 
+    notify_headers = {
+        "content-type": "application/json",
+        "accept": "application/json",
+        "X-Api-Key": pvr.apikey,
+    }
+    pvr.response = http_session().get(pvr.url, headers=notify_headers)
+
+    if pvr.response.status_code != 200:
+        logger.error(f"{ERROR} Something's wrong with {pvr.name}")
+        return pvr
+
+    pvr.response = pvr.response.json()
+    pvr.required = pvr.response["required"]
+    pvr.ignored = pvr.response["ignored"]
+
+    if isinstance(pvr.required, str):
+        pvr.required = pvr.required.split(",")
+    elif not isinstance(pvr.required, list):
+        logger.error(f"{ERROR} Restrictions in {pvr.name} are neither LIST nor STR.")
+        pvr.skip = True
 
-def xrel(args, logger, db, pvrs):
+    return pvr
+
+
+def xrel(args, logger, db, pvrs, updates):
     for category in xrel_categories:
         if args["verbose"]:
             print(f"{VERBOSE} Now processing category {category}")
@@ -240,7 +319,7 @@ def xrel(args, logger, db, pvrs):
         for page in range(1, 51):
             already_processed = []
             logger.debug(f"{VERBOSE} Now processing page {page}")
-            xrel = requests.get(
+            xrel = http_session().get(
                 "https://api.xrel.to/v2/release/browse_category.json"
                 + f"?category_name={category}&per_page=100&page={page}"
             )
@@ -297,11 +376,9 @@ def xrel(args, logger, db, pvrs):
                             pvr.checked.append(newrestriction)
 
                         # don't process release, if group is already whitelisted
-                        if newrestriction not in pvr.required:
-                            pvr.required.append(newrestriction)
-                            pvr = update_pvr(args, logger, db, pvr, newrestriction, release)
-                            logger.info(
-                                f"{ADDED} {newrestriction} to {pvr.name}! Release: {release['dirname']}"
+                        if updates.add(pvr, release["group_name"], release):
+                            logger.debug(
+                                f"{VERBOSE} Queued {newrestriction} for {pvr.name}. Release: {release['dirname']}"
                             )
                         else:
                             logger.info(
@@ -320,6 +397,11 @@ def xrel(args, logger, db, pvrs):
             if len(already_processed) >= len(pvrs):
                 break
 
+        # one PUT per release profile for everything found in this category
+        if not updates.flush():
+            logger.error(f"{ERROR} Could not queue the new groups in category {category}. Try again later.")
+            continue
+
         if latestrelease["time"] != lastprocessed:
             db.cursor.execute(
                 """INSERT INTO latest 
@@ -341,7 +423,7 @@ def xrel(args, logger, db, pvrs):
             logger.info(f"{INFO} Nothing to do in category {category}.")
 
 
-def add_remove(args, logger, db, pvrs):
+def add_remove(args, logger, db, pvrs, updates):
     newrestriction = "-" + "".join(args["group"])
     logger.debug(f"{VERBOSE} Group: {newrestriction}")
     for pvr in pvrs:
@@ -349,77 +431,93 @@ def add_remove(args, logger, db, pvrs):
         if not pvr.skip:
             if args["add"]:
                 logger.debug(f"{VERBOSE} Adding {newrestriction} to {pvr.name}!")
-                if newrestriction not in pvr.required:
-                    pvr.required.append(newrestriction)
-                    pvr = update_pvr(args, logger, db, pvr, newrestriction)
-                    logger.info(f"{ADDED} {newrestriction} to {pvr.name}!")
-                else:
+                if not updates.add(pvr, args["group"]):
                     logger.info(f"{INFO} {newrestriction} is already in {pvr.name}!")
                     continue
             elif args["remove"]:
                 logger.debug(f"{VERBOSE} Removing {newrestriction} from {pvr.name}")
-                if newrestriction in pvr.required:
-                    pvr.required.remove(newrestriction)
-                    pvr = update_pvr(args, logger, db, pvr, newrestriction)
-                    logger.info(f"{REMOVED} {newrestriction} from {pvr.name}!")
-                else:
+                if not updates.remove(pvr, args["group"]):
                     logger.info(f"{INFO} {newrestriction} was not in {pvr.name}!")
                     continue
+    updates.flush()
 
 
-def update_pvr(args, logger, db, pvr, newrestriction, release=None):
+def pvr_payload(pvr):
     pvr.required = list(dict.fromkeys(pvr.required))  # remove duplicates
+    payload = dict(pvr.response)
     if isinstance(pvr.response["required"], str):
-        pvr.response["required"] = ",".join(
+        payload["required"] = ",".join(
             pvr.required
         )  # convert list back to str for radarr
     else:
-        pvr.response["required"] = pvr.required
-    notify_data = pvr.response
+        payload["required"] = list(pvr.required)
+    return payload
+
+
+def put_pvr(pvr, payload=None):
+    from classes import http_session
+
+    if payload is None:
+        payload = pvr_payload(pvr)
     notify_headers = {
         "content-type": "application/json",
         "accept": "application/json",
         "X-Api-Key": pvr.apikey,
     }
-    reply = requests.put(pvr.url, json=notify_data, headers=notify_headers)
-
-    while reply.status_code != 202:
-        logger.error(
-            f"{ERROR} Could not modify {newrestriction} in {pvr.name}. Response code: {reply.status_code}"
-        )
-        logger.debug(f"{VERBOSE} {reply.content}")
-        time.sleep(60)
-        # TO DO: Handle errors
-    if reply.status_code == 202:
-        try:
-            db.cursor.execute(
-                """INSERT INTO scenegroups 
-                (groupname, release, pvr, releasedate, timestamp)
-                VALUES (?, ?, ?, ?, ?)""",
-                (
-                    release["group_name"],
-                    release["dirname"],
-                    pvr.name,
-                    release["time"],
-                    int(datetime.datetime.now(datetime.timezone.utc).timestamp()),
-                ),
+    return http_session().put(pvr.url, json=payload, headers=notify_headers)
+
+
+def record_groups(db, pvr, changes):
+    # changes: (groupname, release) for every group added to or removed from pvr, in one transaction
+    timestamp = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+    db.cursor.executemany(
+        """INSERT INTO scenegroups 
+        (groupname, release, pvr, releasedate, timestamp)
+        VALUES (?, ?, ?, ?, ?)""",
+        [
+            (
+                groupname,
+                release["dirname"] if release else None,
+                pvr.name,
+                release["time"] if release else None,
+                timestamp,
             )
-        except TypeError:
-            db.cursor.execute(
-                """INSERT INTO scenegroups 
-                (groupname, release, pvr, releasedate, timestamp) 
-                VALUES (?, ?, ?, ?, ?)""",
-                (
-                    args["group"],
-                    None,
-                    pvr.name,
-                    None,
-                    int(datetime.datetime.now(datetime.timezone.utc).timestamp()),
-                ),
-            )
-        db.connection.commit()
+            for groupname, release in changes
+        ],
+    )
+    db.connection.commit()
 
-    return pvr
+def latency_report(cfg):
+    # Rank the input servers by the median delay of their pre announcements behind the fastest network
+    try:
+        conn = PreDBWriter.connect(os.getenv("PRE_DB_FILE", PRE_DB_FILE), read_only=True)
+        rows = conn.execute("SELECT source, samples, first, p50, p90, p99, timestamp FROM pre_latency_rollup").fetchall()
+        conn.close()
+    except sqlite3.Error:
+        rows = []
+    if not rows:
+        print(f"{INFO} No statistics yet, they are updated every {pre_latency_rollup_interval} seconds while -p runs.")
+        return
+
+    ranking = []
+    missing = []
+    for server in cfg["input_servers"]:
+        sources = [row for row in rows if row["source"].split("/", 1)[0] == server["host"]]
+        if not sources:
+            missing.append(server["name"])
+        ranking.extend((server["name"], row) for row in sources)
+    ranking.sort(key=lambda item: (item[1]["p50"], -item[1]["first"] / item[1]["samples"]))
+
+    updated = datetime.datetime.fromtimestamp(max(row["timestamp"] for row in rows), datetime.timezone.utc)
+    print(f"Pre latency over the last {pre_latency_days} days, updated {updated:%Y-%m-%d %H:%M} UTC")
+    print(f"{'#':>3} {'server':<20} {'source':<40} {'pres':>7} {'first':>6} {'p50':>8} {'p90':>8} {'p99':>8}")
+    for rank, (name, row) in enumerate(ranking, start=1):
+        print(
+            f"{rank:>3} {name:<20} {row['source']:<40} {row['samples']:>7} {row['first'] / row['samples']:>6.0%} "
+            f"{row['p50']:>7.1f}s {row['p90']:>7.1f}s {row['p99']:>7.1f}s"
+        )
+    for name in missing:
+        print(f"    {name:<20} no pres announced")
 
 # Add a global stop event
 stop_event = threading.Event()
@@ -443,14 +541,29 @@ def main(args=None):
         scene2arr_db = create_scene2arr_db(SCENE2ARR_DB_FILE)
 
         pvrs = init_pvrs(logger)
+        updates = PVRUpdateQueue(logger, PVRWriter(logger, SCENE2ARR_DB_FILE))
+        # also retries changes a previous run couldn't write
+        updates.writer.set_pvrs(pvrs)
         if args["xrel"]:
-            xrel(args, logger, scene2arr_db, pvrs)
+            xrel(args, logger, scene2arr_db, pvrs, updates)
         elif args["add"] or args["remove"]:
-            add_remove(args, logger, scene2arr_db, pvrs)
+            add_remove(args, logger, scene2arr_db, pvrs, updates)
+        # whatever isn't written by then stays in the outbox for the next run
+        updates.close(timeout=pvr_write_timeout)
 
         scene2arr_db.connection.close()
 
+    if args["latency"]:
+        try:
+            with open(IRC_CONFIG_FILE, "r") as ymlfile:
+                cfg = yaml.safe_load(ymlfile)
+        except Exception as e:
+            logger.error(f"{ERROR} loading {IRC_CONFIG_FILE}: {e}")
+            sys.exit(1)
+        latency_report(cfg)
+
     if args["irc"] or args["predb"]:
+        startup = time.monotonic()
         pre_db = create_pre_db(PRE_DB_FILE)
         try:
             with open(IRC_CONFIG_FILE, "r") as ymlfile:
@@ -459,11 +572,47 @@ def main(args=None):
             logger.error(f"{ERROR} loading {IRC_CONFIG_FILE}:", e)
             sys.exit(1)
 
-        shared_lock = threading.Lock()
         threads = []
         bots = []
+        # OutputBots subscribe to what the InputBots and the MetadataAgent publish
+        event_bus = EventBus(logger)
+        metadata_agent = None
+        pvr_manager = None
+        pre_writer = None
+
+        if args["irc"]:
+            # Long-lived *arr session for the IRC bots, instead of a full scene2arr run per pre
+            pvr_manager = PVRManager(args, logger, max_age=pvr_profile_max_age, update_window=pvr_update_window)
+            pvr_manager.stop_event = stop_event
+            threads.append(threading.Thread(target=pvr_manager.run_updates))
+
+        # One pool of PHP ReleaseParser workers shared by all InputBots
+        release_parser = ReleaseParserPool(
+            logger,
+            size=release_parser_workers,
+            timeout=release_parser_timeout,
+            cache_size=release_parser_cache_size,
+            cache_ttl=release_parser_cache_ttl,
+        )
+        release_parser.stop_event = stop_event
+        threads.append(threading.Thread(target=release_parser.run_health_checks, daemon=True))
 
         if args["predb"]:
+            # Single writer for pre.db, so the bots don't take turns committing every message
+            pre_writer = PreDBWriter(
+                logger,
+                os.getenv("PRE_DB_FILE", PRE_DB_FILE),
+                batch_size=pre_db_batch_size,
+                batch_window=pre_db_batch_window,
+                recent_size=pre_db_recent_size,
+                recent_hours=pre_db_recent_hours,
+                latency_max_delay=pre_latency_max_delay,
+                latency_days=pre_latency_days,
+            )
+            pre_writer.stop_event = stop_event
+            threads.append(threading.Thread(target=pre_writer.run))
+            threads.append(threading.Thread(target=pre_writer.run_rollups, args=(pre_latency_rollup_interval,), daemon=True))
+
             output_bots = [OutputBot(
                 args,
                 logger,
@@ -476,7 +625,11 @@ def main(args=None):
                 ircchannels=output_server["channels"],
                 nickserv=output_server.get("nickserv", None),
                 nickserv_command=output_server.get("nickserv_command", None),
-                password=output_server.get("password", None)
+                password=output_server.get("password", None),
+                send_rate=output_server.get("send_rate", output_send_rate),
+                send_burst=output_server.get("send_burst", output_send_burst),
+                queue_size=output_queue_size,
+                info_backlog=output_info_backlog,
             ) for output_server in cfg.get("output_servers", [])]
 
             for bot in output_bots:
@@ -484,12 +637,27 @@ def main(args=None):
                 bot.stop_event = stop_event
                 t = threading.Thread(target=bot.start)
                 threads.append(t)
+                threads.append(threading.Thread(target=bot.run_sender, daemon=True))
                 bots.append(bot)
+                event_bus.subscribe(bot)
 
-            metadata_agent = MetadataAgent(logger, output_bots, shared_lock)
+            metadata_agent = MetadataAgent(
+                logger,
+                event_bus,
+                pre_writer,
+                genre_queue_size=metadata_genre_queue_size,
+                provider_workers=metadata_provider_workers,
+                hedge_delay=metadata_hedge_delay,
+                genre_deadline=metadata_genre_deadline,
+                srrdb_workers=srrdb_fetch_workers,
+                feed_interval_min=srrdb_feed_interval_min,
+                feed_interval_max=srrdb_feed_interval_max,
+            )
             # Pass stop_event to metadata_agent as well if needed
             metadata_agent.stop_event = stop_event
             threads.append(threading.Thread(target=metadata_agent.determine_info, daemon=True))
+            for _ in range(metadata_genre_workers):
+                threads.append(threading.Thread(target=metadata_agent.run_genre_worker, daemon=True))
 
         for server in cfg["input_servers"]:
             name = server["name"]
@@ -514,9 +682,11 @@ def main(args=None):
                 channels,
                 nickserv,
                 nickserv_command,
-                output_bots,
+                event_bus,
                 metadata_agent,
-                shared_lock,
+                pre_writer,
+                release_parser,
+                pvr_manager,
                 password=password,
             )
             bot.stop_event = stop_event
@@ -526,6 +696,7 @@ def main(args=None):
 
         for t in threads:
             t.start()
+        logger.info(f"{INFO} Started {len(threads)} threads in {time.monotonic() - startup:.2f} seconds")
         try:
             while not stop_event.is_set():
                 time.sleep(1)
@@ -540,6 +711,9 @@ def main(args=None):
                     logger.error(f"{ERROR} stopping bot: {e}")
             for t in threads:
                 t.join()
+            release_parser.close()
+            if pvr_manager:
+                pvr_manager.close()
             logger.info("All threads stopped, exiting.")
 
 
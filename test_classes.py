@@ -1,6 +1,234 @@
+import concurrent.futures
+import http.server
+import json
 import unittest
+import unittest.mock
 import yaml
-from classes import ircMessageParser
+import time
+import logging
+import os
+import queue
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from conf import metadata_rate_limits
+import scene2arr
+import classes
+from classes import EventBus, LRUCache, MetadataAgent, MetadataCache, MusicBrainzClient, OutputBot, PVR, PVRUpdateQueue, PVRWriter, PreDBWriter, SpotifyClient, RateLimiter, RateLimitExceeded, ReleaseParserPool, ircMessageParser, new_http_session
+
+class TestPVRWriter(unittest.TestCase):
+    # stands in for the release profile API of an *arr instance
+    class Arr(http.server.BaseHTTPRequestHandler):
+        required = []
+        gets = []  # time.monotonic()
+        puts = []  # (time.monotonic(), required)
+        answers = []  # status codes for the next PUTs, 202 once they run out
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.gets.append(time.monotonic())
+            body = json.dumps({"id": 1, "required": self.required, "ignored": []}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_PUT(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.puts.append((time.monotonic(), payload["required"]))
+            self.send_response(self.answers.pop(0) if self.answers else 202)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    # classes is imported first, the way scene2arr.py -a/-r/-x and -i reach scene2arr
+    SCRIPT = """
+import logging, sys
+import classes
+import scene2arr
+pvr = classes.PVR("sonarr")
+pvr.url, pvr.apikey = sys.argv[1], "key"
+scene2arr.load_pvr(logging.getLogger(), pvr)
+writer = classes.PVRWriter(logging.getLogger(), sys.argv[2])
+writer.set_pvrs([pvr])
+writer.submit(pvr, {"-GRP": ("add", "GRP", None)})
+writer.close(timeout=5)
+"""
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self.Arr)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.Arr.required[:] = ["-OLD"]
+        self.Arr.puts[:] = []
+        self.Arr.answers[:] = []
+        self.puts = self.Arr.puts
+        # the writer does its own retries, a 5xx shouldn't be retried by the session as well
+        patcher = unittest.mock.patch.object(classes, "_http_session", new_http_session(retries=0))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        fd, self.dbname = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, self.dbname)
+        scene2arr.create_scene2arr_db(self.dbname).connection.close()
+        self.pvr = PVR("sonarr")
+        self.pvr.url = f"http://127.0.0.1:{self.server.server_address[1]}/api/v3/releaseprofile/1"
+        self.pvr.apikey = "key"
+        scene2arr.load_pvr(logging.getLogger(__name__), self.pvr)
+
+    def writer(self):
+        writer = PVRWriter(logging.getLogger(__name__), self.dbname)
+        writer.max_attempts = 3
+        writer.backoff = writer.max_backoff = 0.01
+        writer.breaker_threshold = 2
+        writer.breaker_cooldown = 0.3
+        writer.set_pvrs([self.pvr])
+        return writer
+
+    def outbox(self):
+        with sqlite3.connect(self.dbname) as conn:
+            return conn.execute("SELECT pvr, attempts FROM outbox").fetchall()
+
+    def scenegroups(self):
+        with sqlite3.connect(self.dbname) as conn:
+            return conn.execute("SELECT groupname, pvr FROM scenegroups ORDER BY groupname").fetchall()
+
+    def test_backoff_and_circuit_breaker(self):
+        self.Arr.answers[:] = [500, 500]
+        writer = self.writer()
+        writer.submit(self.pvr, {"-GRP": ("add", "GRP", None)})
+        writer.close(timeout=5)
+        self.assertEqual([required for _, required in self.puts], [["-OLD", "-GRP"]] * 3)
+        # the breaker opened after the second failure
+        self.assertGreaterEqual(self.puts[2][0] - self.puts[1][0], 0.3)
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.scenegroups(), [("GRP", "sonarr")])
+
+    def test_give_up(self):
+        self.Arr.answers[:] = [500, 500, 500]
+        writer = self.writer()
+        writer.breaker_threshold = 10
+        writer.submit(self.pvr, {"-GRP": ("add", "GRP", None)})
+        writer.close(timeout=5)
+        self.assertEqual(len(self.puts), 3)
+        self.assertEqual((self.pvr.required, writer.given_up), (["-OLD"], 1))
+        self.assertEqual(self.outbox(), [])
+
+    def test_replay(self):
+        with sqlite3.connect(self.dbname) as conn:
+            conn.executemany(
+                "INSERT INTO outbox (pvr, changes, attempts, timestamp) VALUES (?, ?, ?, 0)",
+                [("sonarr", '{"-GRP": ["add", "GRP", null]}', 1), ("sonarr", '{"-GONE": ["add", "GONE", null]}', 3)],
+            )
+        writer = self.writer()
+        writer.close(timeout=5)
+        # the change that had run out of attempts is dropped
+        self.assertEqual([required for _, required in self.puts], [["-OLD", "-GRP"]])
+        self.assertEqual(self.outbox(), [])
+
+    def test_update_queue(self):
+        updates = PVRUpdateQueue(logging.getLogger(__name__), self.writer())
+        self.assertTrue(updates.add(self.pvr, "A"))
+        self.assertTrue(updates.add(self.pvr, "B"))
+        self.assertFalse(updates.add(self.pvr, "A"))
+        self.assertTrue(updates.remove(self.pvr, "OLD"))
+        # added and removed again before the flush, so it never reaches the instance
+        self.assertTrue(updates.add(self.pvr, "C"))
+        self.assertTrue(updates.remove(self.pvr, "C"))
+        self.assertTrue(updates.flush())
+        updates.writer.close(timeout=5)
+        # a single PUT for all of it
+        self.assertEqual([required for _, required in self.puts], [["-A", "-B"]])
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.scenegroups(), [("A", "sonarr"), ("B", "sonarr"), ("OLD", "sonarr")])
+
+    def test_update_queue_outbox_error(self):
+        writer = self.writer()
+        updates = PVRUpdateQueue(logging.getLogger(__name__), writer)
+        updates.add(self.pvr, "A")
+        updates.remove(self.pvr, "OLD")
+        writer.db.cursor.execute("DROP TABLE outbox")
+        with self.assertLogs(__name__, "ERROR"):
+            self.assertFalse(updates.flush())
+        # the profile is back to what the instance has
+        self.assertEqual(self.pvr.required, ["-OLD"])
+        writer.close(timeout=5)
+        self.assertEqual(self.puts, [])
+
+    def test_classes_imported_first(self):
+        subprocess.run(
+            [sys.executable, "-c", self.SCRIPT, self.pvr.url, self.dbname],
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True, timeout=30,
+        )
+        self.assertEqual([required for _, required in self.puts], [["-OLD", "-GRP"]])
+        self.assertEqual(self.outbox(), [])
+        self.assertEqual(self.scenegroups(), [("GRP", "sonarr")])
+
+class TestPVRManager(unittest.TestCase):
+    def arr(self, name, required):
+        handler = type(name, (TestPVRWriter.Arr,), {"required": required, "gets": [], "puts": [], "answers": []})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return handler, f"http://127.0.0.1:{server.server_address[1]}/api/v3/releaseprofile/1"
+
+    def setUp(self):
+        self.sonarr, sonarr_url = self.arr("Sonarr", ["-A", "-B"])
+        self.radarr, radarr_url = self.arr("Radarr", ["-B", "-C"])
+        environ = {"SONARR_URL": sonarr_url, "SONARR_APIKEY": "key", "RADARR_URL": radarr_url, "RADARR_APIKEY": "key"}
+        for patcher in (
+            unittest.mock.patch.dict(os.environ, environ),
+            unittest.mock.patch.object(classes, "_http_session", new_http_session(retries=0)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ("SONARR4K_URL", "SONARR4K_APIKEY", "RADARR4K_URL", "RADARR4K_APIKEY"):
+            os.environ.pop(name, None)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.dbname = os.path.join(self.tmpdir.name, "scene2arr.db")
+        patcher = unittest.mock.patch.object(classes, "SCENE2ARR_DB_FILE", self.dbname)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = classes.PVRManager({}, logging.getLogger(__name__))
+        self.addCleanup(self.manager.close)
+
+    def test_known_groups(self):
+        # only groups that every instance requires are known
+        self.assertTrue(self.manager.is_known("B"))
+        self.assertFalse(self.manager.is_known("A"))
+        self.assertFalse(self.manager.is_known("C"))
+        self.assertEqual(self.manager.known_groups, {"B"})
+        self.manager.add_group("A")
+        self.assertTrue(self.manager.is_known("A"))
+        self.assertEqual(len(self.sonarr.gets), 1)
+
+    def test_refresh_on_data_version(self):
+        self.assertFalse(self.manager.is_known("C"))
+        self.sonarr.required.append("-C")
+        # nothing changed scene2arr.db, the profiles aren't loaded again
+        self.assertFalse(self.manager.is_known("C"))
+        self.assertEqual(len(self.sonarr.gets), 1)
+        # like scene2arr.py -a/-r in another process
+        with sqlite3.connect(self.dbname) as conn:
+            conn.execute("INSERT INTO scenegroups (groupname, pvr, timestamp) VALUES ('C', 'sonarr', 0)")
+        self.assertTrue(self.manager.is_known("C"))
+        self.assertEqual(len(self.sonarr.gets), 2)
+
+    def test_add_to_arr_skips_known_groups(self):
+        bot = classes.InputBot.__new__(classes.InputBot)
+        bot.logger = logging.getLogger(__name__)
+        bot.pvr_manager = self.manager
+        bot.parse_release = unittest.mock.Mock(return_value=None)
+        bot.add_to_arr(None, None, "", {"release": "Show.S01E01.720p.WEB.h264-B", "section": "TV"})
+        bot.parse_release.assert_not_called()
+        bot.add_to_arr(None, None, "", {"release": "Show.S01E01.720p.WEB.h264-A", "section": "TV"})
+        bot.parse_release.assert_called_once_with("Show.S01E01.720p.WEB.h264-A", "TV")
 
 class TestIRCMessageParser(unittest.TestCase):
     @classmethod
@@ -174,5 +402,624 @@ class TestIRCMessageParser(unittest.TestCase):
                                 self.assertIsNone(result)
 
 
+    def test_single_pass_classifier(self):
+        # Feed the examples of all channels to every channel and compare both parsing modes
+        messages = [
+            message
+            for server in self.config['input_servers']
+            for channel in server['channels']
+            for examples in ('pre_examples', 'nuke_examples', 'info_examples', 'addold_examples')
+            for message in channel.get(examples, [])
+        ]
+        for server in self.config['input_servers']:
+            for channel in server['channels']:
+                parser = ircMessageParser(channel)
+                classifier = ircMessageParser(channel, single_pass=True)
+                self.assertIsNotNone(classifier.classifier)
+                for message in messages:
+                    with self.subTest(server=server['name'], channel=channel['name'], message=message):
+                        expected = [(key, result) for key, result in parser.parse(message) if result is not None]
+                        result = [(key, result) for key, result in classifier.parse(message) if result is not None]
+                        print(f"Testing single pass classifier for server: {server['name']}, channel: {channel['name']}, message: {message}")
+                        print(f"Result: {result}")
+                        self.assertEqual(result, expected)
+                        self.assertEqual(dict(result).get('pre_regex'), parser.preparse(message))
+                        self.assertEqual(dict(result).get('nuke_regex'), parser.nukeparse(message))
+                        self.assertEqual(dict(result).get('info_regex'), parser.infoparse(message))
+                        self.assertEqual(dict(result).get('addold_regex'), parser.addoldparse(message))
+
+        # a global inline flag in one regex would make the whole combined regex case-insensitive
+        channel = {"pre_regex": r"PRE: (\S+) (\S+)", "pre_regex_section": 1, "pre_regex_release": 2, "nuke_regex": r"(?i)NUKE: (\S+)", "nuke_regex_release": 1}
+        parser = ircMessageParser(channel)
+        classifier = ircMessageParser(channel, single_pass=True)
+        self.assertIsNone(classifier.classifier)
+        for message in ("pre: TV Release-GRP", "PRE: TV Release-GRP", "nuke: Release-GRP"):
+            with self.subTest(message=message):
+                self.assertEqual(list(classifier.parse(message)), list(parser.parse(message)))
+        self.assertIsNone(classifier.preparse("pre: TV Release-GRP"))
+
+class TestReleaseParserPool(unittest.TestCase):
+    # stands in for parserelease_worker.php
+    WORKER = """
+import json, sys, time
+for line in sys.stdin:
+    request = json.loads(line)
+    release = request.get("release", "")
+    if release.startswith("Crash"):
+        sys.exit(1)
+    if release.startswith("Hang"):
+        time.sleep(10)
+    if release.startswith("Garbage"):
+        print("PHP Deprecated: something", flush=True)
+    answer = {"pong": True} if "ping" in request else {"echo": release}
+    answer["request_id"] = request.get("request_id")
+    print(json.dumps(answer), flush=True)
+"""
+
+    def setUp(self):
+        self.pool = ReleaseParserPool(logging.getLogger(__name__), size=1, timeout=0.5, command=[sys.executable, "-c", self.WORKER])
+        self.addCleanup(self.pool.close)
+
+    def test_failing_workers_are_replaced(self):
+        self.assertEqual(self.pool.parse("A-GRP", "TV"), {"echo": "A-GRP"})
+        for release in ("Crash-GRP", "Hang-GRP", "Garbage-GRP"):
+            with self.assertRaises(subprocess.CalledProcessError):
+                self.pool.parse(release, "TV")
+            # the next release gets its own answer, not a leftover one
+            self.assertEqual(self.pool.parse(f"After-{release}", "TV"), {"echo": f"After-{release}"})
+        self.assertEqual(self.pool.stats()["restarts"], 6)
+        self.assertEqual(self.pool.stats()["cache"]["size"], 4)
+        self.pool.check_health()
+        self.assertEqual(self.pool.stats()["restarts"], 6)
+
+class TestLRUCache(unittest.TestCase):
+    def test_eviction_order(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # "b" is now the least recently used entry
+        cache.set("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_ttl_and_counters(self):
+        cache = LRUCache(maxsize=10, ttl=0.05)
+        cache.set("release", None)
+        self.assertIsNone(cache.get("release", LRUCache.missing))
+        time.sleep(0.1)
+        self.assertIs(cache.get("release", LRUCache.missing), LRUCache.missing)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_add_and_discard(self):
+        cache = LRUCache(maxsize=2)
+        self.assertTrue(cache.add("a"))
+        self.assertFalse(cache.add("a"))
+        cache.discard("a")
+        self.assertTrue(cache.add("a"))
+        cache.add("b")
+        cache.add("c")
+        self.assertTrue(cache.add("a"))  # evicted by "c"
+
+    def test_max_bytes(self):
+        cache = LRUCache(maxsize=10, max_bytes=10, sizeof=lambda key, value: len(value))
+        cache.set("a", "xxxx")
+        cache.set("b", "xxxx")
+        cache.set("a", "xxxxxx")  # replacing an entry doesn't count it twice
+        self.assertEqual(cache.stats()["bytes"], 10)
+        cache.set("c", "xx")
+        self.assertIs(cache.get("b", LRUCache.missing), LRUCache.missing)
+        self.assertEqual((len(cache), cache.stats()["bytes"]), (2, 8))
+        cache.set("d", "x" * 11)  # too big to keep at all
+        self.assertEqual((len(cache), cache.stats()["bytes"]), (0, 0))
+
+class TestRateLimiter(unittest.TestCase):
+    def test_all_windows_must_have_budget(self):
+        limiter = RateLimiter({"api": [(2, 60), (1, 0.05)]})
+        self.assertTrue(limiter.try_acquire("api"))
+        self.assertFalse(limiter.try_acquire("api"))  # the short window is empty
+        time.sleep(0.06)
+        self.assertTrue(limiter.try_acquire("api"))
+        time.sleep(0.06)
+        with self.assertRaises(RateLimitExceeded):
+            limiter.acquire("api")  # the long window is empty
+        self.assertTrue(limiter.try_acquire("unlimited"))
+        self.assertEqual(limiter.stats()["api"], {"allowed": 2, "denied": 2})
+
+    def test_musicbrainz_lookup_within_limits(self):
+        answers = {
+            "artist/": {"artists": [{"id": "artist-1"}]},
+            "release-group/": {"release-groups": [{"id": "album-1", "title": "Album"}]},
+            "release-group/album-1": {"genres": [{"name": "Hip Hop"}]},
+        }
+        session = unittest.mock.Mock()
+        session.get.side_effect = lambda url, **kwargs: unittest.mock.Mock(json=unittest.mock.Mock(return_value=answers[url.split("/ws/2/")[1]]))
+        client = MusicBrainzClient(RateLimiter(metadata_rate_limits), MetadataCache(":memory:"))
+        client.session = session
+        start = time.monotonic()
+        # three requests at one per second
+        self.assertEqual(client.get_genres("Artist", "Album"), ["Hip Hop"])
+        self.assertGreaterEqual(time.monotonic() - start, 1.9)
+        self.assertEqual(session.get.call_count, 3)
+        self.assertEqual(client.limiter.stats()["musicbrainz"], {"allowed": 3, "denied": 0})
+
+class TestMetadataCache(unittest.TestCase):
+    def test_hits_misses_and_eviction(self):
+        cache = MetadataCache(":memory:", hit_ttl=60, miss_ttl=-1, max_entries=10)
+        cache.set("tvmaze", "show", ["Drama"])
+        cache.set("tvmaze", "unknown", None)  # already expired
+        self.assertEqual(cache.get("tvmaze", "show"), ["Drama"])
+        self.assertIs(cache.get("tvmaze", "show", 2024), MetadataCache.missing)
+        self.assertIs(cache.get("tvmaze", "unknown"), MetadataCache.missing)
+        for i in range(98):
+            cache.set("omdb", f"title{i}", ["Comedy"])
+        stats = cache.stats()
+        self.assertEqual(stats["size"], 10)
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_access_time(self):
+        cache = MetadataCache(":memory:", touch_interval=60)
+        cache.set("tvmaze", "show", ["Drama"])
+        key = ("tvmaze", MetadataCache.key("show"))
+        writes = cache.conn.total_changes
+        for _ in range(3):
+            cache.memory.discard(key)  # read it from disk
+            self.assertEqual(cache.get("tvmaze", "show"), ["Drama"])
+        # read just after it was stored, the access time is recent enough
+        self.assertEqual(cache.conn.total_changes, writes)
+        cache.conn.execute("UPDATE metadata_cache SET accessed = accessed - 60")
+        writes = cache.conn.total_changes
+        for _ in range(3):
+            cache.memory.discard(key)
+            self.assertEqual(cache.get("tvmaze", "show"), ["Drama"])
+        self.assertEqual(cache.conn.total_changes, writes + 1)
+
+class TestSpotifyToken(unittest.TestCase):
+    class Session:
+        def __init__(self):
+            self.posts = 0
+
+        def post(self, url, headers=None, data=None):
+            self.posts += 1
+            response = unittest.mock.Mock()
+            response.json.return_value = {"access_token": f"token-{self.posts}", "expires_in": 3600}
+            return response
+
+    def test_cold_and_cached_token(self):
+        cache = MetadataCache(":memory:")
+        client = SpotifyClient(RateLimiter({}), cache)
+        client.session = self.Session()
+        client.ensure_token_valid()  # nothing cached yet
+        self.assertEqual((client.access_token, client.session.posts), ("token-1", 1))
+        # a new client, e.g. after a restart, uses the cached token
+        client = SpotifyClient(RateLimiter({}), cache)
+        client.session = self.Session()
+        client.ensure_token_valid()
+        self.assertEqual((client.access_token, client.session.posts), ("token-1", 0))
+
+class TestFirstGenres(unittest.TestCase):
+    def agent(self, hedge_delay, genre_deadline=5):
+        agent = MetadataAgent.__new__(MetadataAgent)
+        agent.logger = logging.getLogger(__name__)
+        agent.limiter = RateLimiter({})
+        agent.providers = concurrent.futures.ThreadPoolExecutor(4)
+        agent.genre_lock = threading.Lock()
+        agent.genre_timeouts = 0
+        agent.hedge_delay = hedge_delay
+        agent.genre_deadline = genre_deadline
+        self.addCleanup(agent.providers.shutdown, wait=False)
+        return agent
+
+    @staticmethod
+    def provider(delay, genres):
+        def get_genres():
+            time.sleep(delay)
+            return genres
+        return (get_genres, (), {})
+
+    def test_priority_and_hedging(self):
+        agent = self.agent(hedge_delay=0.05)
+        start = time.monotonic()
+        # the slow first provider is hedged, but its answer still wins
+        self.assertEqual(agent.first_genres([self.provider(0.3, "Drama"), self.provider(0, "Comedy")]), ["drama"])
+        # an empty answer falls through to the next provider right away
+        self.assertEqual(agent.first_genres([self.provider(0, None), self.provider(0, "Comedy")]), ["comedy"])
+        self.assertEqual(agent.first_genres([self.provider(0.3, None), self.provider(0, "Comedy")]), ["comedy"])
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_sequential_and_deadline(self):
+        calls = []
+        agent = self.agent(hedge_delay=None, genre_deadline=0.2)
+        first = (lambda: calls.append(1) or "Drama", (), {})
+        second = (lambda: calls.append(2) or "Comedy", (), {})
+        self.assertEqual(agent.first_genres([first, second]), ["drama"])
+        self.assertEqual(calls, [1])
+        self.assertIsNone(agent.first_genres([self.provider(1, "Drama")]))
+        self.assertEqual(agent.genre_timeouts, 1)
+        # the next provider isn't started once the deadline has passed
+        self.assertIsNone(agent.first_genres([self.provider(0.3, None), second]))
+        time.sleep(0.2)
+        self.assertEqual(calls, [1])
+        self.assertEqual(agent.genre_timeouts, 2)
+
+    def test_failing_provider(self):
+        agent = self.agent(hedge_delay=None)
+        broken = (lambda: {}["genres"], (), {})
+        self.assertEqual(agent.first_genres([broken, self.provider(0, "Comedy")]), ["comedy"])
+        # each answer is looked at once, however long the others take
+        agent = self.agent(hedge_delay=0.01)
+        with self.assertLogs(__name__) as logs:
+            self.assertEqual(agent.first_genres([broken, self.provider(0.1, None), self.provider(0.2, "Comedy")]), ["comedy"])
+        self.assertEqual(len(logs.records), 1)
+
+class TestGenreQueue(unittest.TestCase):
+    def test_full_queue(self):
+        agent = MetadataAgent.__new__(MetadataAgent)
+        agent.logger = logging.getLogger(__name__)
+        agent.genre_queue = queue.Queue(maxsize=1)
+        agent.genre_lock = threading.Lock()
+        agent.genre_done = agent.genre_dropped = agent.genre_failed = agent.genre_timeouts = 0
+        agent.determine_genre = lambda parsed_release: [parsed_release["release"]]
+        answers = []
+        self.assertTrue(agent.submit_genre({"release": "Release-1"}, answers.append))
+        # no worker is running yet, so there is no room for a second lookup
+        self.assertFalse(agent.submit_genre({"release": "Release-2"}, answers.append))
+        self.assertFalse(agent.submit_genre({"release": "Release-3"}, answers.append))
+        self.assertEqual(agent.stats(), {"queued": 1, "done": 0, "dropped": 2, "failed": 0, "timeouts": 0})
+        agent.stop_event = threading.Event()
+        worker = threading.Thread(target=agent.run_genre_worker)
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(agent.stop_event.set)
+        deadline = time.monotonic() + 5
+        while agent.stats()["done"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(answers, [["Release-1"]])
+        self.assertEqual(agent.stats(), {"queued": 0, "done": 1, "dropped": 2, "failed": 0, "timeouts": 0})
+
+class TestSrrDBFeed(unittest.TestCase):
+    class Feed(http.server.BaseHTTPRequestHandler):
+        entries = []
+        requests = []
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.requests.append(self.headers.get("If-None-Match"))
+            etag = f'"{len(self.entries)}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            items = "".join(f"<item><title>{title}</title><guid>{title}</guid></item>" for title in self.entries)
+            body = f'<?xml version="1.0"?><rss version="2.0"><channel><title>srrDB</title>{items}</channel></rss>'.encode()
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self.Feed)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.agent = MetadataAgent.__new__(MetadataAgent)
+        self.agent.logger = logging.getLogger(__name__)
+        self.agent.session = new_http_session(retries=0)
+        self.agent.srrdb_feed_url = f"http://127.0.0.1:{self.server.server_address[1]}/feed/srrs"
+        self.agent.feed_etag = self.agent.feed_modified = self.agent.feed_last = None
+        self.agent.feed_polled = self.agent.feed_cadence = None
+        self.agent.feed_interval_min, self.agent.feed_interval_max = 30, 600
+        self.agent.feed_interval = 30
+
+    def test_conditional_get(self):
+        self.Feed.entries[:] = ["Release-2", "Release-1"]
+        self.assertEqual(self.agent.poll_feed(), ["Release-1", "Release-2"])
+        self.assertEqual(self.agent.poll_feed(), [])  # 304
+        self.Feed.entries[:] = ["Release-4", "Release-3", "Release-2", "Release-1"]
+        self.assertEqual(self.agent.poll_feed(), ["Release-3", "Release-4"])
+        self.assertEqual(self.Feed.requests[-3:], [None, '"2"', '"2"'])
+
+    def test_adaptive_interval(self):
+        self.assertEqual(self.agent.next_poll_interval(0, now=0), 30)
+        self.assertEqual(self.agent.next_poll_interval(1, now=100), 100)  # one release in 100 seconds
+        self.assertEqual(self.agent.next_poll_interval(0, now=200), 150)  # nothing new, back off
+        self.assertEqual(self.agent.next_poll_interval(0, now=350), 225)
+        self.assertAlmostEqual(self.agent.next_poll_interval(50, now=360), 70.06)  # busy, average comes down
+        self.assertAlmostEqual(self.agent.next_poll_interval(0, now=10000), 105.09)
+        for now in range(10001, 10020):
+            interval = self.agent.next_poll_interval(0, now=now)
+        self.assertEqual(interval, 600)
+
+class TestOutputBot(unittest.TestCase):
+    class Connection:
+        def __init__(self):
+            self.sent = []
+
+        def is_connected(self):
+            return True
+
+        def privmsg(self, channel, message):
+            self.sent.append((channel, message))
+
+    def setUp(self):
+        channels = [{"name": "#pre", "type": "pre"}, {"name": "#info", "type": "info"}]
+        self.bot = OutputBot({}, logging.getLogger(__name__), "test", "localhost", 6667, False, "bot", None, channels, None, None, send_rate=100, send_burst=1, info_backlog=3)
+        self.bot.connection = self.Connection()
+
+    def test_merge_drop_and_pace(self):
+        bus = EventBus(logging.getLogger(__name__))
+        bus.subscribe(self.bot)
+        info = {"release": "Release-1", "type": "INFO", "files": 1, "size": None}
+        bus.publish("info", info)
+        bus.publish("info", dict(info, files=2))  # replaces the first one
+        genre = dict(info, type="GENRE", genre="Drama/Comedy")
+        bus.publish("info", genre)
+        self.assertEqual(genre["genre"], "Drama/Comedy")  # published data isn't changed
+        bus.publish("info", dict(info, release="Release-2"))
+        bus.publish("info", dict(info, release="Release-3"))  # backlog reached
+        self.assertEqual(self.bot.stats()["queued"], 3)
+        self.assertEqual((self.bot.stats()["merged"], self.bot.stats()["dropped"]), (1, 1))
+        self.bot.stop_event = threading.Event()
+        sender = threading.Thread(target=self.bot.run_sender)
+        start = time.monotonic()
+        sender.start()
+        while self.bot.stats()["sent"] < 3 and time.monotonic() - start < 5:
+            time.sleep(0.01)
+        self.bot.stop_event.set()
+        sender.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)  # 3 lines at 100 per second
+        self.assertEqual([channel for channel, _ in self.bot.connection.sent], ["#info"] * 3)
+        self.assertEqual(self.bot.connection.sent[0][1], '{"release": "Release-1", "type": "INFO", "files": 2}')
+        self.assertEqual(self.bot.connection.sent[1][1], '{"release": "Release-1", "type": "GENRE", "files": 1, "genre": ["Drama", "Comedy"]}')
+
+class TestPreMergeRules(unittest.TestCase):
+    COLUMNS = ("release", "type", "section", "size", "files", "genre", "source", "timestamp")
+
+    def apply(self, stored, handler, *args):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE pre (release TEXT UNIQUE, type TEXT, section TEXT, size INTEGER, files INTEGER, genre TEXT, source TEXT, timestamp INTEGER)")
+        if stored:
+            conn.execute(f"INSERT INTO pre ({', '.join(stored)}) VALUES ({', '.join('?' * len(stored))})", list(stored.values()))
+        changed = handler(conn.cursor(), *args)
+        row = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM pre").fetchone()
+        conn.close()
+        return {column: value for column, value in zip(self.COLUMNS, row) if value is not None}, changed
+
+    def test_record_info(self):
+        release = {"release": "Release-GRP"}
+        pre = dict(release, type="PRE", section="TV", source="irc/#pre", timestamp=100)
+        info = dict(release, type="INFO", size=5, files=2, genre=None)
+        genre = dict(release, type="GENRE", size=None, files=None, genre="Drama")
+        # (stored row, event, expected row, announced)
+        cases = [
+            (None, info, dict(release, type="INFO", size=5, files=2, source="irc/#info", timestamp=200), True),
+            (pre, info, dict(pre, size=5, files=2), True),
+            (dict(pre, size=10, files=3), info, dict(pre, size=10, files=3), False),  # only filled in when empty
+            (dict(pre, size=0, files=0), info, dict(pre, size=5, files=2), True),
+            (pre, genre, dict(pre, genre="Drama"), True),
+            (dict(pre, genre="-"), genre, dict(pre, genre="Drama"), True),
+            (dict(pre, genre="Comedy"), genre, dict(pre, genre="Comedy"), False),
+            (pre, dict(info, type="OTHER"), pre, False),
+        ]
+        for stored, event, expected, announced in cases:
+            with self.subTest(stored=stored, event=event):
+                self.assertEqual(self.apply(stored, PreDBWriter.record_info, event, "irc/#info", 200), (expected, announced))
+
+    def test_record_addold(self):
+        release = {"release": "Release-GRP"}
+        pre = dict(release, type="PRE", section="PRE", source="irc/#pre", timestamp=100)
+        addold = dict(release, type="ADDOLD", section="TV", size="700", files="15", genre="Drama", timestamp="50")
+        empty = dict(addold, section="None", size="0", files="0", genre="None", timestamp="0")
+        cases = [
+            (None, addold, dict(release, type="ADDOLD", section="TV", size=700, files=15, genre="Drama", source="irc/#addold", timestamp=50)),
+            (None, empty, dict(release, type="ADDOLD", source="irc/#addold")),
+            # the section is upgraded from PRE, a PRE keeps its type and timestamp
+            (pre, addold, dict(pre, section="TV", size=700, files=15, genre="Drama")),
+            (dict(pre, section="X264"), addold, dict(pre, section="X264", size=700, files=15, genre="Drama")),
+            (pre, dict(addold, section="PRE"), dict(pre, size=700, files=15, genre="Drama")),
+            # only empty fields are filled in
+            (dict(pre, size=350, files=8, genre="Comedy"), addold, dict(pre, section="TV", size=350, files=8, genre="Comedy")),
+            (dict(pre, size=0, files=0, genre=""), addold, dict(pre, section="TV", size=700, files=15, genre="Drama")),
+            # an INFO without a timestamp becomes an ADDOLD with the first timestamp known,
+            # a missing section is only ever upgraded from PRE
+            (dict(release, type="INFO", size=5, files=2), addold, dict(release, type="ADDOLD", size=5, files=2, genre="Drama", timestamp=50)),
+            (dict(release, type="ADDOLD", timestamp=40), addold, dict(release, type="ADDOLD", size=700, files=15, genre="Drama", timestamp=40)),
+            (dict(release, type="INFO", timestamp=40), empty, dict(release, type="ADDOLD", timestamp=40)),
+        ]
+        for stored, event, expected in cases:
+            with self.subTest(stored=stored, event=event):
+                # ADDOLD messages are never announced
+                self.assertEqual(self.apply(stored, PreDBWriter.record_addold, event, "irc/#addold"), (expected, False))
+
+class TestNukeState(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def state(self, conn):
+        return {row[0]: tuple(row[1:]) for row in conn.execute("SELECT release, type, reason, nukenet, timestamp FROM nuke_state")}
+
+    def test_record_nuke(self):
+        dbname = os.path.join(self.tmpdir.name, "pre.db")
+        scene2arr.create_pre_db(dbname).connection.close()
+        conn = PreDBWriter.connect(dbname)
+        self.addCleanup(conn.close)
+        cursor = conn.cursor()
+
+        def nuke(release, type, reason, nukenet, source, currenttime):
+            result = {"release": release, "type": type, "reason": reason, "nukenet": nukenet}
+            return PreDBWriter.record_nuke(cursor, result, source, currenttime)
+
+        self.assertTrue(nuke("A", "NUKE", "dupe", "net", "irc/#nuke", 10))
+        self.assertTrue(nuke("A", "UNNUKE", "fine", "net", "irc/#nuke", 20))
+        self.assertTrue(nuke("A", "MODNUKE", "bad.ivtc", "net", "irc/#nuke", 30))
+        # the same nuke from another channel
+        self.assertFalse(nuke("A", "MODNUKE", "bad.ivtc", "net", "irc/#other", 31))
+        # out of order, a late copy of an older nuke doesn't replace the current state
+        self.assertTrue(nuke("B", "UNNUKE", "fine", "net", "irc/#nuke", 20))
+        self.assertTrue(nuke("B", "NUKE", "dupe", "net", "irc/#nuke", 10))
+        # predataba.se reports modnukes as nukes, the modnuke from another network replaces it
+        self.assertTrue(nuke("C", "NUKE", "stolen", "net", "irc.predataba.se/#pre", 10))
+        self.assertTrue(nuke("C", "MODNUKE", "stolen", "net", "irc/#nuke", 11))
+        self.assertFalse(nuke("C", "MODNUKE", "stolen", "net", "irc.predataba.se/#pre", 12))
+        # a nuke announced without a nukenet gets it from a later copy
+        self.assertTrue(nuke("D", "NUKE", "dupe", None, "irc/#nuke", 10))
+        self.assertFalse(nuke("D", "NUKE", "dupe", "net", "irc/#other", 11))
+        self.assertEqual(self.state(conn), {
+            "A": ("MODNUKE", "bad.ivtc", "net", 30),
+            "B": ("UNNUKE", "fine", "net", 20),
+            "C": ("MODNUKE", "stolen", "net", 11),
+            "D": ("NUKE", "dupe", "net", 10),
+        })
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM nuke").fetchone()[0], 7)
+
+    def test_convert_pre_db_v4(self):
+        # pre.db as left behind by version 3, without nuke_state
+        with sqlite3.connect(os.path.join(self.tmpdir.name, "pre.db")) as conn:
+            conn.execute("CREATE TABLE pre (id INTEGER PRIMARY KEY AUTOINCREMENT, release TEXT UNIQUE, type TEXT, section TEXT, size INTEGER, files INTEGER, genre TEXT, source TEXT, timestamp INTEGER)")
+            conn.execute("CREATE TABLE nuke (id INTEGER PRIMARY KEY AUTOINCREMENT, release TEXT, type TEXT, reason TEXT, nukenet TEXT, source TEXT, timestamp INTEGER)")
+            conn.executemany(
+                "INSERT INTO nuke (release, type, reason, nukenet, source, timestamp) VALUES (?, ?, ?, 'net', 'irc/#nuke', ?)",
+                [
+                    ("A", "NUKE", "dupe", 10), ("A", "UNNUKE", "fine", 20), ("A", "MODNUKE", "bad.ivtc", 30),
+                    # stored out of order
+                    ("B", "MODNUKE", "bad.ivtc", 30), ("B", "NUKE", "dupe", 5),
+                    # same second, the later row wins
+                    ("C", "NUKE", "dupe", 10), ("C", "UNNUKE", "fine", 10),
+                ],
+            )
+            conn.execute("PRAGMA user_version = 3")
+        conn.close()
+        with open(os.path.join(self.tmpdir.name, "irc.yaml"), "w") as file:
+            file.write("input_servers:\n")
+        subprocess.run(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run_post_update.py")],
+            cwd=self.tmpdir.name, check=True, timeout=30, capture_output=True,
+        )
+        with sqlite3.connect(os.path.join(self.tmpdir.name, "pre.db")) as conn:
+            self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], 4)
+            self.assertEqual(self.state(conn), {
+                "A": ("MODNUKE", "bad.ivtc", "net", 30),
+                "B": ("MODNUKE", "bad.ivtc", "net", 30),
+                "C": ("UNNUKE", "fine", "net", 10),
+            })
+        conn.close()
+
+class TestPreDBWriter(unittest.TestCase):
+    def setUp(self):
+        fd, self.dbname = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        scene2arr.create_pre_db(self.dbname).connection.close()
+        self.writer = PreDBWriter(logging.getLogger(__name__), self.dbname, batch_size=10, batch_window=0.01)
+        self.writer.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.writer.run)
+        self.thread.start()
+
+    def tearDown(self):
+        self.writer.stop_event.set()
+        self.thread.join()
+        os.remove(self.dbname)
+
+    def test_batch_results(self):
+        futures = [self.writer.submit(PreDBWriter.insert_pre, {"release": f"Release-{i}", "section": "TV"}, "irc/#pre", i) for i in range(25)]
+        duplicate = self.writer.submit(PreDBWriter.insert_pre, {"release": "Release-1", "section": "TV"}, "irc/#pre", 0)
+        broken = self.writer.submit(lambda cursor: cursor.execute("INSERT INTO missing VALUES (1)"))
+        malformed = self.writer.submit(PreDBWriter.insert_pre, {"release": "Release-x"}, "irc/#pre", 0)
+        info = self.writer.submit(PreDBWriter.record_info, {"release": "Release-2", "type": "INFO", "size": 5, "files": 2, "genre": None}, "irc/#info", 0)
+        self.assertTrue(all(future.result(timeout=5) for future in futures))
+        self.assertFalse(duplicate.result(timeout=5))
+        self.assertIsInstance(broken.exception(timeout=5), sqlite3.Error)
+        self.assertIsInstance(malformed.exception(timeout=5), KeyError)
+        # the failed event doesn't take the rest of its batch with it
+        self.assertTrue(info.result(timeout=5))
+        with sqlite3.connect(self.dbname) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*), SUM(size) FROM pre").fetchone(), (25, 5))
+
+    def test_bad_batch(self):
+        # a batch that fails outside the handlers doesn't end the writer thread
+        with unittest.mock.patch.object(self.writer, "_apply", side_effect=RuntimeError("boom")):
+            failed = self.writer.submit(PreDBWriter.insert_pre, {"release": "Release-1", "section": "TV"}, "irc/#pre", 0)
+            self.assertIsInstance(failed.exception(timeout=5), RuntimeError)
+        self.assertTrue(self.writer.submit(PreDBWriter.insert_pre, {"release": "Release-2", "section": "TV"}, "irc/#pre", 0).result(timeout=5))
+        self.assertTrue(self.thread.is_alive())
+
+    def test_claim_and_warm(self):
+        self.assertTrue(self.writer.claim_pre("Release-1", "irc/#a", 1000.0))
+        # the same pre from another network
+        self.assertFalse(self.writer.claim_pre("Release-1", "irc/#b", 1001.0))
+        now = int(time.time())
+        with sqlite3.connect(self.dbname) as conn:
+            conn.executemany(
+                "INSERT INTO pre (release, type, section, source, timestamp) VALUES (?, 'PRE', 'TV', 'irc/#a', ?)",
+                [("Release-2", now - 60), ("Release-3", now - 3600), ("Release-old", now - 25 * 3600)],
+            )
+        writer = PreDBWriter(logging.getLogger(__name__), self.dbname, recent_hours=24)
+        self.addCleanup(writer.conn.close)
+        writer.warm()
+        self.assertEqual(len(writer.recent_pres), 2)
+        self.assertFalse(writer.claim_pre("Release-2", "irc/#a", time.time()))
+        self.assertFalse(writer.claim_pre("Release-3", "irc/#a", time.time()))
+        # older than recent_hours, pre.db has the final say
+        self.assertTrue(writer.claim_pre("Release-old", "irc/#a", time.time()))
+
+    def test_latency_samples(self):
+        with sqlite3.connect(self.dbname) as conn:
+            conn.execute("INSERT INTO pre (release, type, section, source, timestamp) VALUES ('Release-old', 'PRE', 'TV', 'irc/#a', 0)")
+        for release in ("Release-new", "Release-old"):
+            # first seen by this process, but only Release-new is new to pre.db
+            self.assertTrue(self.writer.claim_pre(release, "irc/#a", 1000.0))
+            self.writer.submit(PreDBWriter.insert_pre, {"release": release, "section": "TV"}, "irc/#a", 1000, 1000.0).result(timeout=5)
+        self.assertFalse(self.writer.claim_pre("Release-new", "irc/#b", 1002.5))
+        self.writer.submit(lambda cursor: None).result(timeout=5)
+        with sqlite3.connect(self.dbname) as conn:
+            samples = conn.execute("SELECT release, source, delay FROM pre_latency ORDER BY release, source").fetchall()
+        self.assertEqual(samples, [("Release-new", "irc/#a", 0.0), ("Release-new", "irc/#b", 2.5)])
+
+    def test_rollup_latency(self):
+        fd, dbname = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, dbname)
+        scene2arr.create_pre_db(dbname).connection.close()
+        conn = sqlite3.connect(dbname)
+        conn.row_factory = sqlite3.Row
+        samples = [(f"Release-{i}", "irc/#a", float(i), 1000) for i in range(100)]
+        samples += [("Release-0", "irc/#b", 0.0, 1000), ("Release-1", "irc/#b", 0.0, 1000), ("Release-2", "irc/#b", 5.0, 1000)]
+        samples += [("Release-old", "irc/#b", 0.0, 10), ("Release-old", "irc/#c", 1.0, 10)]  # older than since
+        conn.executemany("INSERT INTO pre_latency (release, source, delay, timestamp) VALUES (?, ?, ?, ?)", samples)
+        PreDBWriter.rollup_latency(conn.cursor(), 500)
+        rollup = conn.execute("SELECT source, samples, first, p50, p90, p99 FROM pre_latency_rollup ORDER BY source").fetchall()
+        self.assertEqual([tuple(row) for row in rollup], [("irc/#a", 100, 1, 50.0, 90.0, 99.0), ("irc/#b", 3, 2, 0.0, 5.0, 5.0)])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM pre_latency").fetchone()[0], 103)
+        conn.close()
+
+    def test_missing_infos(self):
+        agent = MetadataAgent.__new__(MetadataAgent)
+        agent.conn = PreDBWriter.connect(self.dbname, read_only=True)
+        self.addCleanup(agent.conn.close)
+        with sqlite3.connect(self.dbname) as conn:
+            conn.executemany(
+                "INSERT INTO pre (release, type, section, size, files, source, timestamp) VALUES (?, 'PRE', 'TV', ?, ?, 'irc/#a', 0)",
+                [(f"Release-{i}", None if i % 3 == 0 else 5, 1) for i in range(1200)],
+            )
+        # more releases than fit in one query, some of them twice across a chunk boundary, some not in pre.db
+        releases = [f"Release-{i}" for i in reversed(range(1200))] + ["Release-999", "Release-3", "Unknown-1"]
+        self.assertEqual(agent.missing_infos(releases), [f"Release-{i}" for i in reversed(range(0, 1200, 3))])
+
+    def test_update_infos(self):
+        for release in ("Release-1", "Release-2"):
+            self.writer.submit(PreDBWriter.insert_pre, {"release": release, "section": "TV"}, "irc/#pre", 0)
+        files = [{"name": "release.r00", "size": 3 * 1024 * 1024}, {"name": "release.nfo", "size": 1}, {"name": "Sample/sample.mkv", "size": 1024 * 1024}]
+        self.assertEqual(MetadataAgent.count_files(files), (1, 3))
+        infos = [{"release": "Release-1", "files": 1, "size": 3}, {"release": "Release-3", "files": 1, "size": 3}]
+        self.assertEqual(self.writer.submit(PreDBWriter.update_infos, infos).result(timeout=5), {"Release-1"})
+        # nothing changed the second time
+        self.assertEqual(self.writer.submit(PreDBWriter.update_infos, infos).result(timeout=5), set())
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file